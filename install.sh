@@ -191,6 +191,7 @@ cd $DIR
 pwd
 sudo apt-get install python3-pip python3-setuptools python3-pil python3-smbus
 sudo -H pip3 install flask
+sudo -H pip3 install waitress
 sudo -H python3 setup.py install
 
 # Install jetcard display service
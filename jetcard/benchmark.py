@@ -0,0 +1,540 @@
+import argparse
+import os
+import sys
+import subprocess
+import tempfile
+import threading
+import time
+import timeit
+import types
+import PIL.Image
+import PIL.ImageDraw
+import PIL.ImageFont
+from .oled import TextCache, image_to_pages
+from .procfs import ProcfsBackend
+from .protocol import PROTOCOL_BINARY, PROTOCOL_JSON, frame
+from .buttons import ButtonEvent, ButtonInput, SimulatedGPIO, SwitchAction, CENTER_CHANNEL, DOWN_CHANNEL, UP_CHANNEL
+
+PROC_STAT = '''cpu  2255 34 2290 22625563 6290 127 456 0 0 0
+cpu0 1132 34 1441 11311718 3675 127 438 0 0 0
+cpu1 1123 0 849 11313845 2614 0 18 0 0 0
+intr 114930548 113199788 3 0 5 263 0 4 [... lots more numbers ...]
+ctxt 1990473
+btime 1062191376
+processes 2915
+procs_running 1
+procs_blocked 0
+'''
+
+PROC_MEMINFO = '''MemTotal:        4051060 kB
+MemFree:         1612340 kB
+MemAvailable:    2689496 kB
+Buffers:           95604 kB
+Cached:           986452 kB
+SwapCached:            0 kB
+SReclaimable:      61520 kB
+'''
+
+NVPMODEL_CONF = '''< POWER_MODEL ID=0 NAME=MAXN >
+CPU_ONLINE CORE_0 1
+< POWER_MODEL ID=1 NAME=5W >
+CPU_ONLINE CORE_0 1
+'''
+
+
+def _sample_image(width: int, height: int) -> PIL.Image.Image:
+    image = PIL.Image.new('1', (width, height))
+    draw = PIL.ImageDraw.Draw(image)
+    font = PIL.ImageFont.load_default()
+    for top in range(0, height, 8):
+        draw.text((0, top - 2), 'jetcard benchmark %d' % top, font=font, fill=255)
+    return image
+
+
+def bench_convert(number: int = 200) -> None:
+    '''
+    Compare Adafruit_SSD1306 image() with the vectorized image_to_pages()
+    '''
+    from Adafruit_SSD1306.SSD1306 import SSD1306Base
+    for width, height in [(128, 32), (128, 64)]:
+        image = _sample_image(width, height)
+        # image() only needs the buffer geometry, avoid opening the I2C bus
+        display = types.SimpleNamespace(width=width, height=height, _pages=height // 8,
+                                        _buffer=[0] * (width * height // 8))
+        SSD1306Base.image(display, image)
+        assert display._buffer == image_to_pages(image).tolist(), 'converter output mismatch'
+        legacy = timeit.timeit(lambda: SSD1306Base.image(display, image), number=number) / number
+        vectorized = timeit.timeit(lambda: image_to_pages(image), number=number) / number
+        print('{w}x{h}: Adafruit image() {l:.3f} ms, image_to_pages() {v:.3f} ms, {s:.1f}x faster'.format(
+            w=width, h=height, l=legacy * 1e3, v=vectorized * 1e3, s=legacy / vectorized))
+
+
+def make_procfs_fixture(root: str) -> None:
+    files = {'proc/stat': PROC_STAT,
+             'proc/meminfo': PROC_MEMINFO,
+             'etc/nvpmodel.conf': NVPMODEL_CONF,
+             'var/lib/nvpmodel/status': 'pmode:0001\n',
+             'sys/devices/gpu.0/load': '372\n',
+             'sys/class/net/eth0/operstate': 'up\n'}
+    for path, content in files.items():
+        path = os.path.join(root, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+
+
+def bench_metrics(number: int = 50) -> None:
+    '''
+    Per-call latency of forked shell pipelines versus ProcfsBackend, both on a fixture procfs tree
+    '''
+    with tempfile.TemporaryDirectory() as root:
+        make_procfs_fixture(root)
+        backend = ProcfsBackend(root)
+        # values the fixture files stand for, the first cpu_usage() call averages since boot
+        expected = {
+            'cpu_usage': (2255 + 34 + 2290 + 127 + 456) / (2255 + 34 + 2290 + 22625563 + 6290 + 127 + 456),
+            'memory_usage': (4051060 - 2689496) / 4051060,
+            'power_mode': '5W',
+            'gpu_usage': 0.372,
+        }
+        for name, value in expected.items():
+            result = getattr(backend, name)()
+            assert result == value if isinstance(value, str) else abs(result - value) < 1e-9, \
+                '%s returned %r, expected %r' % (name, result, value)
+        # df rounds the percentage up
+        df_percent = int(subprocess.check_output("df -P %s | awk 'NR==2{print $5}'" % root, shell=True).decode().strip().rstrip('%'))
+        assert df_percent - 1 <= backend.disk_usage() * 100 <= df_percent, 'disk_usage disagrees with df'
+        # jetcard.utils used to fork top, free, df, nvpmodel and ifconfig, which need the live system,
+        # these pipelines of the same shape (shell + grep / awk) read the fixture files instead
+        pipelines = {
+            'cpu_usage': "grep '^cpu ' %s/proc/stat | awk '{printf \"%%.2f\", ($2+$3+$4)/($2+$3+$4+$5)}'" % root,
+            'memory_usage': "awk '/MemTotal/{t=$2} /MemFree/{f=$2} END{printf \"%%.2f\", (t-f)*100/t}' %s/proc/meminfo" % root,
+            'disk_usage': "df -h %s | awk 'NR==2{printf \"%%s\", $5}'" % root,
+            'power_mode': "grep -o 'pmode:[0-9]*' %s/var/lib/nvpmodel/status" % root,
+            'gpu_usage': "cat %s/sys/devices/gpu.0/load" % root,
+        }
+        for name, cmd in pipelines.items():
+            method = getattr(backend, name)
+            method()
+            before = timeit.timeit(lambda: subprocess.check_output(cmd, shell=True), number=number) / number
+            after = timeit.timeit(method, number=number * 100) / (number * 100)
+            print('{n:>13}: subprocess {b:.3f} ms, procfs {a:.4f} ms, {s:.0f}x faster'.format(
+                n=name, b=before * 1e3, a=after * 1e3, s=before / after))
+        backend.close()
+
+
+def _press_latency(consume, presses: int) -> list:
+    gpio = SimulatedGPIO()
+    buttons = ButtonInput(gpio, bouncetime=0)
+    latencies = []
+    running = True
+    def loop():
+        while running:
+            event = consume(gpio, buttons)
+            if event:
+                latencies.append(time.monotonic() - event.timestamp)
+    thread = threading.Thread(target=loop)
+    thread.start()
+    for i in range(presses):
+        time.sleep(0.013 * (i % 7 + 1))    # press at varying phases of the loop period
+        gpio.press(CENTER_CHANNEL)
+        gpio.release(CENTER_CHANNEL)
+    time.sleep(0.1)
+    running = False
+    thread.join()
+    return sorted(latencies)
+
+
+def bench_input(presses: int = 40) -> None:
+    '''
+    Press-to-wakeup latency of the 50 ms menu loop, polling versus event driven
+    '''
+    def polling(gpio, buttons):
+        time.sleep(0.05)
+        buttons.clear()
+        if gpio.event_detected(CENTER_CHANNEL):
+            return ButtonEvent(SwitchAction.PRESS_CENTER, gpio.last_edge[CENTER_CHANNEL])
+    def event_driven(gpio, buttons):
+        buttons.wait_pressed(0.05)
+        return buttons.get()
+    for name, consume in [('polling', polling), ('event driven', event_driven)]:
+        latencies = _press_latency(consume, presses)
+        print('{n:>12}: p50 {p50:.2f} ms, max {m:.2f} ms over {c} presses'.format(
+            n=name, p50=latencies[len(latencies) // 2] * 1e3, m=latencies[-1] * 1e3, c=len(latencies)))
+
+
+def _dfs_find(item, uuid: str):
+    # the recursive search Menu.find used before the uuid index
+    if item.uuid == uuid:
+        return item
+    for o in getattr(item, 'obj_list', []):
+        ret = _dfs_find(o, uuid)
+        if ret is not None:
+            return ret
+    return None
+
+
+def bench_menu(items: int = 10000, fanout: int = 20) -> None:
+    '''
+    Build a menu tree of `items` items through the uuid index, then time lookups against a recursive search
+    '''
+    from .display_server import Menu, Variable
+    root = Menu()
+    menus = [root]
+    start = time.perf_counter()
+    for i in range(items):
+        parent = root.find(menus[i // fanout].uuid)
+        if i % fanout == 0:
+            item = Menu(root=parent, name='m%d' % i, uuid='m%d' % i)
+            menus.append(item)
+        else:
+            item = Variable(root=parent, name='v%d' % i, value=i, step=1, uuid='v%d' % i)
+        parent.add(item)
+    build = time.perf_counter() - start
+    uuids = ['v%d' % i for i in range(1, items, max(items // 200, 1)) if i % fanout]
+    indexed = timeit.timeit(lambda: [root.find(u) for u in uuids], number=1) / len(uuids)
+    recursive = timeit.timeit(lambda: [_dfs_find(root, u) for u in uuids], number=1) / len(uuids)
+    assert all(root.find(u) is _dfs_find(root, u) for u in uuids)
+    start = time.perf_counter()
+    root.reset()
+    reset = time.perf_counter() - start
+    assert len(root.index) == 1, 'reset left %d items in the index' % len(root.index)
+    print('{n} items: build {b:.1f} ms, find {f:.2f} us (recursive {r:.2f} us), reset {s:.1f} ms'.format(
+        n=items, b=build * 1e3, f=indexed * 1e6, r=recursive * 1e6, s=reset * 1e3))
+
+
+def bench_ipc(number: int = 20000) -> None:
+    '''
+    Encode + frame + decode throughput of the JSON and binary protocols
+    '''
+    from .display_server import IPCPacket
+    traffic = {
+        'create_item': IPCPacket(action='create_item', kwargs={'root': 'base', 'name': 'learning rate', 'uuid': '2b1e0f8c-4f9e-4c55-9a55-5b0d7f1c2a61',
+                                                                'create_type': 'var', 'value': 0.001, 'step': 0.0001}),
+        'update_value': IPCPacket(action='update_value', kwargs={'uuid': '2b1e0f8c-4f9e-4c55-9a55-5b0d7f1c2a61', 'value': 0.0012}),
+    }
+    for name, packet in traffic.items():
+        for version, label in [(PROTOCOL_JSON, 'json'), (PROTOCOL_BINARY, 'binary')]:
+            def roundtrip():
+                data = frame(packet.encode(version), version)
+                IPCPacket.decode(data[2 if version == PROTOCOL_JSON else 4:], version)
+            elapsed = timeit.timeit(roundtrip, number=number)
+            size = len(frame(packet.encode(version), version))
+            print('{n:>12} {l:>6}: {r:8.0f} msg/s, {s:3d} bytes/msg'.format(n=name, l=label, r=number / elapsed, s=size))
+
+
+def bench_recv(packets: int = 5000) -> None:
+    '''
+    Drain a burst of JSON create_item packets, former 1024 byte recv + bytes concatenation versus IPCConnection
+    '''
+    import socket
+    from .display_server import IPCConnection, IPCPacket
+    burst = [IPCPacket(action='create_item', kwargs={'root': 'base', 'name': 'item %d' % i, 'uuid': 'uuid-%d' % i, 'create_type': 'item'})
+             for i in range(packets)]
+
+    def legacy(conn: socket.socket) -> int:
+        recv_data = b''
+        parsed = ticks = 0
+        while parsed < packets:
+            ticks += 1
+            try:
+                recv_data += conn.recv(1024)
+            except BlockingIOError:
+                pass
+            while len(recv_data) > 2:
+                packet_len = recv_data[0] | (recv_data[1] << 8)
+                if len(recv_data) - 2 < packet_len:
+                    break
+                IPCPacket(json_str=recv_data[2:packet_len+2].decode())
+                recv_data = recv_data[packet_len+2:]
+                parsed += 1
+        return ticks
+
+    def buffered(conn: socket.socket) -> int:
+        connection = IPCConnection(conn)
+        parsed = ticks = 0
+        while parsed < packets:
+            ticks += 1
+            parsed += len(connection.recv())
+        return ticks
+
+    for name, reader in [('legacy', legacy), ('buffered', buffered)]:
+        server, client = socket.socketpair()
+        server.setblocking(False)
+        client.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 22)
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 22)
+        sender = IPCConnection(client, blocking=True)
+        thread = threading.Thread(target=sender.send, args=(burst,))
+        thread.start()
+        thread.join(0.5)    # let the burst queue up in the socket as far as the buffers allow
+        start = time.perf_counter()
+        ticks = reader(server)
+        elapsed = time.perf_counter() - start
+        thread.join()
+        server.close()
+        client.close()
+        print('{n:>9}: {p} packets in {t:.1f} ms, {k} loop ticks ({d:.1f} s at the 50 ms menu frame period)'.format(
+            n=name, p=packets, t=elapsed * 1e3, k=ticks, d=ticks * 0.05))
+
+
+def bench_text(items: int = 200, frames: int = 400) -> None:
+    '''
+    Render menu frames while scrolling a long menu, ImageDraw.text versus the TextCache blits
+    '''
+    from .display_server import DisplayInfo, Item, Menu
+    image = PIL.Image.new('1', (128, 32))
+    draw = PIL.ImageDraw.Draw(image)
+    font = PIL.ImageFont.load_default()
+
+    class UncachedText(TextCache):
+        def draw_text(self, draw, xy, text, font, fill=255):
+            draw.text(xy, text, font=font, fill=fill)
+
+    for name, cache in [('draw.text', UncachedText()), ('cached', TextCache())]:
+        disp_info = DisplayInfo(image.width, image.height, font, 6, 8, cache)
+        menu = Menu()
+        for i in range(items):
+            menu.add(Item(root=menu, name='item %d' % i, uuid='uuid-%d' % i))
+        start = time.perf_counter()
+        for _ in range(frames):
+            draw.rectangle((0, 0, image.width, image.height), outline=0, fill=0)
+            menu.press_down_callback(disp_info, draw, None)
+            menu.render(disp_info, draw, None)
+        elapsed = time.perf_counter() - start
+        print('{n:>9}: {t:.3f} ms/frame, {h} hits, {m} misses'.format(
+            n=name, t=elapsed / frames * 1e3, h=cache.hits, m=cache.misses))
+
+
+def bench_graph(frames: int = 500) -> None:
+    '''
+    Render a graph page from a full metrics history, clear + draw + page conversion per frame
+    '''
+    import numpy as np
+    from .graph import GRAPH_METRICS, draw_graph
+    from .history import MetricsHistory
+    from .sampler import StatsSnapshot
+    history = MetricsHistory()
+    rng = np.random.default_rng(0)
+    for i in range(history.fine.capacity):
+        history.record(StatsSnapshot(available=True, timestamp=1e9 + i, power_watts=float(rng.uniform(2, 10)),
+                                     cpu_percent=float(rng.uniform(0, 100)), gpu_percent=float(rng.uniform(0, 100)),
+                                     ram_percent=float(rng.uniform(0, 100))))
+    image = PIL.Image.new('1', (128, 32))
+    draw = PIL.ImageDraw.Draw(image)
+    font = PIL.ImageFont.load_default()
+    cache = TextCache()
+    for metric in GRAPH_METRICS:
+        start = time.perf_counter()
+        for _ in range(frames):
+            draw.rectangle((0, 0, image.width, image.height), outline=0, fill=0)
+            draw_graph(draw, cache, font, metric, history.latest(metric, image.width), image.width, image.height)
+            image_to_pages(image)
+        elapsed = time.perf_counter() - start
+        print('{m:>6}: {t:.3f} ms/frame'.format(m=metric, t=elapsed / frames * 1e3))
+
+
+# run in a fresh interpreter by measure_startup(), prints time.monotonic() marks as JSON
+STARTUP_SCRIPT = '''
+import json, os, sys, time
+from jetcard import display_server
+imported = time.monotonic()
+from jetcard.hardware import FramebufferDisplay, ScriptedGPIO, SyntheticJtop
+server = display_server.DisplayServer(display=FramebufferDisplay(), gpio=ScriptedGPIO(), jtop_factory=SyntheticJtop,
+                                      menu_address=sys.argv[1])
+ready = time.monotonic()
+display_server.create_app()
+http = time.monotonic()
+print(json.dumps({'import': imported, 'first_frame': server.first_frame, 'ready': ready, 'http': http}), flush=True)
+os._exit(0)
+'''
+
+
+def measure_startup(runs: int = 5) -> dict:
+    '''
+    Median milliseconds from spawning `python -m jetcard.display_server` like systemd does to the import being done,
+    the IP screen on the panel, the daemon running and the HTTP API importable
+    '''
+    import json
+    marks = {'import': [], 'first_frame': [], 'ready': [], 'http': []}
+    with tempfile.TemporaryDirectory() as root:
+        for _ in range(runs):
+            spawned = time.monotonic()
+            output = subprocess.check_output([sys.executable, '-c', STARTUP_SCRIPT, os.path.join(root, 'menu_socket')],
+                                             cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+            for name, mark in json.loads(output.decode().strip().splitlines()[-1]).items():
+                marks[name].append((mark - spawned) * 1e3)
+    return {'startup_%s_ms' % name: sorted(values)[len(values) // 2] for name, values in marks.items()}
+
+
+def bench_startup() -> None:
+    '''
+    Process start to first frame of the display daemon on the simulated hardware
+    '''
+    for name, value in measure_startup().items():
+        print('{n:>24}: {v:.1f} ms'.format(n=name, v=value))
+
+
+# regression limits of the simulated end-to-end suite, name -> (measure, '<' or '>', limit)
+THRESHOLDS = {
+    'frame_ms': ('menu frame, draw + convert + push', '<', 5.0),
+    'press_to_pixels_ms': ('button edge to the last byte of its frame, median', '<', 25.0),
+    'ipc_msg_per_s': ('update_value packets through the menu socket', '>', 20000.0),
+    'tree_10k_ms': ('create_tree of 10k items through the menu socket', '<', 500.0),
+    'find_10k_us': ('uuid lookup in the 10k item tree', '<', 5.0),
+    'reset_10k_ms': ('reset_menu of the 10k item tree', '<', 100.0),
+    'startup_first_frame_ms': ('process start to the IP screen on the panel', '<', 500.0),
+}
+
+
+def _on_display_thread(server, func):
+    # run func between two scheduler passes, the menu tree is only touched by the display thread
+    done = threading.Event()
+    result = []
+    def call():
+        result.append(func())
+        done.set()
+    server.post(call)
+    assert done.wait(10.0), 'display thread did not run the posted call'
+    return result[0]
+
+
+def _wait_packets(server, count: int, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while server.packets_handled < count:
+        assert time.monotonic() < deadline, 'only %d of %d packets handled' % (server.packets_handled, count)
+        time.sleep(0.001)
+
+
+def run_suite(items: int = 10000, fanout: int = 20, frames: int = 200, presses: int = 16, packets: int = 20000) -> dict:
+    '''
+    Drive a DisplayServer on simulated hardware end to end, return the THRESHOLDS measurements
+    '''
+    import socket
+    from .display_server import DisplayServer, IPCConnection, IPCPacket
+    from .hardware import FramebufferDisplay, ScriptedGPIO, SyntheticJtop
+    results = {}
+    with tempfile.TemporaryDirectory() as root:
+        display = FramebufferDisplay()
+        gpio = ScriptedGPIO()
+        server = DisplayServer(display=display, gpio=gpio, jtop_factory=SyntheticJtop,
+                               menu_address=os.path.join(root, 'menu_socket'))
+        conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        conn.connect(server.ipc.address)
+        client = IPCConnection(conn, blocking=True)
+        client.hello()
+        try:
+            # the whole tree in one packet, menus of fanout items each
+            tree = []
+            for i in range(items):
+                if i % fanout == 0:
+                    tree.append({'create_type': 'menu', 'root': 'base', 'name': 'menu %d' % i, 'uuid': 'm%d' % i})
+                else:
+                    tree.append({'create_type': 'var', 'root': 'm%d' % (i - i % fanout), 'name': 'var %d' % i,
+                                 'uuid': 'v%d' % i, 'value': i, 'step': 1})
+            handled = server.packets_handled
+            start = time.perf_counter()
+            client.send([IPCPacket(action='create_tree', kwargs={'items': tree})])
+            _wait_packets(server, handled + 1)
+            results['tree_10k_ms'] = (time.perf_counter() - start) * 1e3
+            assert len(server.root_menu.index) == items + 1, 'tree has %d items' % len(server.root_menu.index)
+            uuids = ['v%d' % i for i in range(1, items, 7) if i % fanout]
+            results['find_10k_us'] = timeit.timeit(lambda: [server.root_menu.find(u) for u in uuids], number=1) / len(uuids) * 1e6
+
+            # framing, socket, reactor thread, decode and dispatch of an update_value stream
+            handled = server.packets_handled
+            burst = [IPCPacket(action='update_value', kwargs={'uuid': 'v%d' % (i % (fanout - 1) + 1), 'value': i})
+                     for i in range(packets)]
+            start = time.perf_counter()
+            for i in range(0, packets, 100):
+                client.send(burst[i:i+100])
+            _wait_packets(server, handled + packets)
+            results['ipc_msg_per_s'] = packets / (time.perf_counter() - start)
+
+            gpio.play([(0.0, CENTER_CHANNEL, 0.0)]).join()
+            deadline = time.monotonic() + 2.0
+            while not server.menu_on and time.monotonic() < deadline:
+                time.sleep(0.01)
+            assert server.menu_on, 'center press did not open the menu'
+            def scroll():
+                start = time.perf_counter()
+                for _ in range(frames):
+                    server.render_menu(SwitchAction.PRESS_DOWN)
+                return time.perf_counter() - start
+            results['frame_ms'] = _on_display_thread(server, scroll) / frames * 1e3
+
+            # alternate up and down so every channel stays outside its 200 ms debounce window
+            gpio.played = []
+            script = [(0.15, DOWN_CHANNEL if i % 2 else UP_CHANNEL, 0.0) for i in range(presses)]
+            gpio.play(script).join()
+            time.sleep(0.1)
+            writes = [t for t, _ in display._i2c.log]
+            edges = [t for _, t in gpio.played] + [float('inf')]
+            latencies = []
+            for edge, following in zip(edges, edges[1:]):
+                frame = [t for t in writes if edge < t < following]
+                assert frame, 'press at %.3f was not drawn' % edge
+                latencies.append(frame[-1] - edge)
+            latencies.sort()
+            results['press_to_pixels_ms'] = latencies[len(latencies) // 2] * 1e3
+
+            handled = server.packets_handled
+            start = time.perf_counter()
+            client.send([IPCPacket(action='reset_menu', kwargs={'uuid': None})])
+            _wait_packets(server, handled + 1)
+            results['reset_10k_ms'] = (time.perf_counter() - start) * 1e3
+            assert len(server.root_menu.index) == 1, 'reset left %d items in the index' % len(server.root_menu.index)
+        finally:
+            conn.close()
+            server.stop()
+    results.update(measure_startup())
+    return results
+
+
+def check(results: dict) -> bool:
+    '''
+    Print every measurement against its threshold, return False on a regression
+    '''
+    ok = True
+    for name, (description, op, limit) in THRESHOLDS.items():
+        value = results[name]
+        passed = value < limit if op == '<' else value > limit
+        ok = ok and passed
+        print('{r} {n:>22}: {v:10.2f} (limit {o} {l:g}), {d}'.format(
+            r='PASS' if passed else 'FAIL', n=name, v=value, o=op, l=limit, d=description))
+    return ok
+
+
+def bench_suite() -> None:
+    '''
+    End-to-end DisplayServer run on FramebufferDisplay, ScriptedGPIO and SyntheticJtop
+    '''
+    check(run_suite())
+
+
+BENCHMARKS = {
+    'convert': bench_convert,
+    'graph': bench_graph,
+    'input': bench_input,
+    'ipc': bench_ipc,
+    'menu': bench_menu,
+    'recv': bench_recv,
+    'startup': bench_startup,
+    'suite': bench_suite,
+    'metrics': bench_metrics,
+    'text': bench_text,
+}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('benchmark', nargs='*', help='benchmarks to run (%s), default all' % ', '.join(sorted(BENCHMARKS)))
+    parser.add_argument('--check', action='store_true', help='run the simulated suite only, exit 1 if a threshold is missed')
+    args = parser.parse_args()
+    for name in args.benchmark:
+        if name not in BENCHMARKS:
+            parser.error('unknown benchmark %s' % name)
+    if args.check:
+        sys.exit(0 if check(run_suite()) else 1)
+    for name in args.benchmark or sorted(BENCHMARKS):
+        print('== %s' % name)
+        BENCHMARKS[name]()
@@ -0,0 +1,158 @@
+import queue
+import threading
+import time
+from enum import Enum
+from typing import Any, Callable, Dict, List, NamedTuple, Union
+
+UP_CHANNEL = 13
+RIGHT_CHANNEL = 15
+LEFT_CHANNEL = 16
+DOWN_CHANNEL = 18
+CENTER_CHANNEL = 19
+
+class SwitchAction(Enum):
+    PRESS_NOTHING = 0
+    PRESS_CENTER = 1
+    PRESS_UP = 2
+    PRESS_DOWN = 3
+    PRESS_LEFT = 4
+    PRESS_RIGHT = 5
+
+CHANNEL_ACTIONS = {UP_CHANNEL: SwitchAction.PRESS_UP,
+                   RIGHT_CHANNEL: SwitchAction.PRESS_RIGHT,
+                   LEFT_CHANNEL: SwitchAction.PRESS_LEFT,
+                   DOWN_CHANNEL: SwitchAction.PRESS_DOWN,
+                   CENTER_CHANNEL: SwitchAction.PRESS_CENTER}
+# channels checked for a held button (auto repeat), in priority order
+HOLD_CHANNELS = [UP_CHANNEL, DOWN_CHANNEL, LEFT_CHANNEL, RIGHT_CHANNEL]
+
+
+class ButtonEvent(NamedTuple):
+    action: SwitchAction
+    timestamp: float    # time.monotonic() of the edge
+
+
+class SimulatedGPIO:
+    '''
+    In-memory stand-in for the subset of Jetson.GPIO used by ButtonInput.
+
+    press()/release() drive the pin level and fire the registered rising edge
+    callbacks in the calling thread, honouring the bounce time.
+    '''
+    BOARD = 10
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    RISING = 31
+
+    def __init__(self) -> None:
+        self.levels: Dict[int, int] = {}
+        self.callbacks: Dict[int, List[Callable[[int], None]]] = {}
+        self.bouncetime: Dict[int, float] = {}
+        self.detected: Dict[int, bool] = {}
+        self.last_edge: Dict[int, float] = {}
+
+    def setmode(self, mode: int) -> None:
+        pass
+
+    def setup(self, channel: int, direction: int) -> None:
+        self.levels[channel] = self.LOW
+
+    def add_event_detect(self, channel: int, edge: int, callback: Union[Callable[[int], None], None] = None,
+                         bouncetime: Union[int, None] = None) -> None:
+        self.callbacks[channel] = [callback] if callback else []
+        self.bouncetime[channel] = (bouncetime or 0) / 1000
+        self.detected[channel] = False
+
+    def add_event_callback(self, channel: int, callback: Callable[[int], None]) -> None:
+        self.callbacks[channel].append(callback)
+
+    def event_detected(self, channel: int) -> bool:
+        detected = self.detected.get(channel, False)
+        self.detected[channel] = False
+        return detected
+
+    def input(self, channel: int) -> int:
+        return self.levels[channel]
+
+    def cleanup(self) -> None:
+        self.callbacks = {}
+
+    def press(self, channel: int) -> None:
+        self.levels[channel] = self.HIGH
+        now = time.monotonic()
+        if now - self.last_edge.get(channel, -1e9) < self.bouncetime.get(channel, 0):
+            return
+        self.last_edge[channel] = now
+        self.detected[channel] = True
+        for callback in list(self.callbacks.get(channel, [])):
+            callback(channel)
+
+    def release(self, channel: int) -> None:
+        self.levels[channel] = self.LOW
+
+
+def default_gpio() -> Any:
+    import Jetson.GPIO as GPIO
+    return GPIO
+
+
+class ButtonInput:
+    '''
+    Event driven reader of the five navigation buttons.
+
+    Rising edges are reported by GPIO callbacks and pushed as timestamped
+    ButtonEvent into a thread-safe queue, a consumer blocked in wait() is
+    woken up as soon as a button is pressed.
+    '''
+    def __init__(self, gpio: Any = None, bouncetime: int = 200, wakeup: Union[threading.Event, None] = None) -> None:
+        '''
+        wakeup: event set on every press, may be shared with other event sources of the consumer
+        '''
+        self.gpio = gpio if gpio is not None else default_gpio()
+        self.events: 'queue.Queue[ButtonEvent]' = queue.Queue()
+        self.pressed = wakeup if wakeup is not None else threading.Event()
+        self.gpio.setmode(self.gpio.BOARD)
+        for channel in CHANNEL_ACTIONS:
+            self.gpio.setup(channel, self.gpio.IN)
+            self.gpio.add_event_detect(channel, self.gpio.RISING, bouncetime=bouncetime)
+            self.gpio.add_event_callback(channel, self._on_edge)
+
+    def _on_edge(self, channel: int) -> None:
+        self.events.put(ButtonEvent(CHANNEL_ACTIONS[channel], time.monotonic()))
+        self.pressed.set()
+
+    def get(self) -> Union[ButtonEvent, None]:
+        try:
+            return self.events.get_nowait()
+        except queue.Empty:
+            return None
+
+    def wait(self, timeout: float) -> Union[ButtonEvent, None]:
+        '''
+        return the next event, or None if nothing is pressed within timeout seconds
+        '''
+        try:
+            return self.events.get(timeout=max(timeout, 0))
+        except queue.Empty:
+            return None
+
+    def wait_pressed(self, timeout: float) -> bool:
+        '''
+        Sleep up to timeout seconds without consuming events, return early when a button is pressed
+        '''
+        if not self.events.empty():
+            return True
+        self.pressed.wait(max(timeout, 0))
+        self.pressed.clear()
+        return not self.events.empty()
+
+    def clear(self) -> None:
+        while self.get() is not None:
+            pass
+
+    def held_action(self) -> SwitchAction:
+        for channel in HOLD_CHANNELS:
+            if self.gpio.input(channel) == self.gpio.HIGH:
+                return CHANNEL_ACTIONS[channel]
+        return SwitchAction.PRESS_NOTHING
@@ -1,56 +1,84 @@
 import threading
-import Adafruit_SSD1306
 import time
 import PIL.Image
 import PIL.ImageFont
 import PIL.ImageDraw
-from flask import Flask
-from .utils import ip_address, power_mode, power_usage, cpu_usage, gpu_usage, memory_usage, disk_usage
-import Jetson.GPIO as GPIO
+from .procfs import ProcfsBackend
+from .oled import FramePusher, TextCache, image_to_pages
+from .sampler import IP_INTERFACES, JtopSampler, StatsSnapshot, default_jtop_factory
+from .hardware import FramebufferDisplay, ScriptedGPIO, SyntheticJtop, default_display
+from .history import METRICS, MetricsHistory
+from .graph import GRAPH_METRICS, draw_graph
+from .stream import STREAM_SUBSCRIBERS, SnapshotBroadcast
+from .exporter import CONTENT_TYPE, MetricsExporter
+from .profiling import PROFILE_ENV, timings
+from .scheduler import Scheduler
+from .buttons import ButtonEvent, ButtonInput, SwitchAction
+from .protocol import PROTOCOL_JSON, PROTOCOL_VERSION, HEADER_SIZE, announced_version, announcement, decode_binary, decode_json, encode_binary, encode_json, frame, frame_length
+import argparse
+import collections
 import os
+import signal
+import sys
+import queue
+import select
+import selectors
 import socket
 import decimal
 import json
-from enum import Enum
-from typing import List, Tuple, Union, Any
+import numpy as np
+from typing import Callable, List, Tuple, Union, Any
 from uuid import uuid4
-from jtop import jtop
 
-UP_CHANNEL = 13
-RIGHT_CHANNEL = 15
-LEFT_CHANNEL = 16
-DOWN_CHANNEL = 18
-CENTER_CHANNEL = 19
-
-class SwitchAction(Enum):
-    PRESS_NOTHING = 0
-    PRESS_CENTER = 1
-    PRESS_UP = 2
-    PRESS_DOWN = 3
-    PRESS_LEFT = 4
-    PRESS_RIGHT = 5
+CONSOLE_CAPACITY = 64   # lines kept by a Console, older lines are dropped
 
 
 class DisplayInfo:
-    def __init__(self, display_width: int, display_height: int, font: int, font_width: int, font_height: int) -> None:
+    def __init__(self, display_width: int, display_height: int, font: int, font_width: int, font_height: int,
+                 text_cache: Union[TextCache, None] = None, history: Union[MetricsHistory, None] = None) -> None:
         self.max_line = display_height // font_height
+        self.height = display_height
         self.line_height = font_height
         self.line_width = display_width
         self.font = font
         self.font_width = font_width
+        self.text_cache = text_cache if text_cache is not None else TextCache()
+        self.history = history
+    def text(self, draw: PIL.ImageDraw, xy: Tuple[int, int], text: str, fill: int = 255) -> None:
+        self.text_cache.draw_text(draw, xy, text, self.font, fill)
+
+class MenuIndex(dict):
+    '''
+    uuid to item lookup shared by every item of one menu tree
+    '''
+    def register(self, item: 'Item') -> None:
+        self[item.uuid] = item
+    def unregister(self, item: 'Item') -> None:
+        # only drop the entry if it still belongs to this item, the uuid may have been re-created
+        if self.get(item.uuid) is item:
+            del self[item.uuid]
 
 class Item:
     def __init__(self, root: Union[Any, None] = None, name: str = "", uuid: str = "") -> None:
         assert uuid != "", "uuid field cannot be empty string"
         self.root: Union[Any, None] = root
+        self.index: MenuIndex = root.index if root is not None else MenuIndex()
         self.name: str = name
         self.uuid: str = uuid
         self.lhs_display: str = name
         self.rhs_display: str = ""
+        self.live: bool = False     # redrawn on every new stats sample while shown
     def get_display_info(self) -> Tuple[str, str]:
         return self.lhs_display, self.rhs_display
     def find(self, uuid: str) -> Union[Any, None]:
         return self if self.uuid == uuid else None
+    def contains(self, item: Union['Item', None]) -> bool:
+        # follow the parent links, proportional to the depth of item
+        while item is not None:
+            if item is self:
+                return True
+            item = item.root
+        return False
     def press_center_callback(self, disp_info: DisplayInfo, draw: PIL.ImageDraw, ipc: 'IPC') -> Union[Any, None]:
         return None
     def press_up_callback(self, disp_info: DisplayInfo, draw: PIL.ImageDraw, ipc: 'IPC') -> Union[Any, None]:
@@ -99,21 +127,26 @@ class Menu(Item):
         self.select_idx: int = 0
         self.first_display_idx: int = 0
         self.lhs_display = ">> " + name
+        if root is None:
+            self.index.register(self)
     def add(self, obj: Item) -> None:
         self.obj_list.append(obj)
+        self.index.register(obj)
     def reset(self) -> None:
         for o in self.obj_list:
             if isinstance(o, Menu):
                 o.reset()
+        for o in self.obj_list[1:]:
+            self.index.unregister(o)
         self.obj_list = self.obj_list[:1]
     def find(self, uuid: str) -> Union[Item, None]:
-        ret = super().find(uuid)
-        if ret == None:
-            for o in self.obj_list:
-                ret = o.find(uuid)
-                if ret != None:
-                    break
-        return ret
+        with timings.measure('menu.find'):
+            item = self.index.get(uuid)
+            return item if self.contains(item) else None
+    def row_count(self) -> int:
+        return len(self.obj_list)
+    def row(self, idx: int) -> Tuple[str, str]:
+        return self.obj_list[idx].get_display_info()
     def press_center_callback(self, disp_info: DisplayInfo, draw: PIL.ImageDraw, ipc: 'IPC') -> Union[Item, None]:
         if len(self.obj_list) == 0:
             return None
@@ -123,10 +156,11 @@ class Menu(Item):
     def press_down_callback(self, disp_info: DisplayInfo, draw: PIL.ImageDraw, ipc: 'IPC') -> Union[Any, None]:
         self.select_idx += 1
     def render(self, disp_info: DisplayInfo, draw: PIL.ImageDraw, ipc: 'IPC') -> Any:
+        row_count = self.row_count()
         if self.select_idx < 0:
-            self.select_idx = len(self.obj_list)-1
-            self.first_display_idx = max(len(self.obj_list) - disp_info.max_line, 0)
-        elif self.select_idx >= len(self.obj_list):
+            self.select_idx = row_count-1
+            self.first_display_idx = max(row_count - disp_info.max_line, 0)
+        elif self.select_idx >= row_count:
             self.select_idx = 0
             self.first_display_idx = 0
         elif self.select_idx < self.first_display_idx:
@@ -136,22 +170,35 @@ class Menu(Item):
         print("fidx {i}, sidx {j}".format(i=self.first_display_idx, j=self.select_idx))
         for i in range(disp_info.max_line):
             idx = self.first_display_idx + i
-            if idx == len(self.obj_list):
+            if idx == row_count:
                 break
             x = 0
             y = disp_info.line_height * i - 2
-            obj = self.obj_list[idx]
-            lhs, rhs = obj.get_display_info()
+            lhs, rhs = self.row(idx)
             if idx == self.select_idx:
                 draw.rectangle((x, y+2, disp_info.line_width, y+disp_info.line_height+2), outline=255, fill=255)
                 fill = 0
             else:
                 fill = 255
-            draw.text((x, y), lhs, font=disp_info.font, fill=fill)
+            disp_info.text(draw, (x, y), lhs, fill=fill)
             rhs_len = len(rhs)
             if rhs_len:
                 x = disp_info.line_width - rhs_len * disp_info.font_width
-                draw.text((x, y), rhs, font=disp_info.font, fill=fill)
+                disp_info.text(draw, (x, y), rhs, fill=fill)
+        return self
+
+class Graph(Item):
+    def __init__(self, root: Union[Any, None] = None, name: str = "", uuid: str = "", metric: str = "cpu") -> None:
+        super().__init__(root=root, name=name, uuid=uuid)
+        self.metric = metric if metric in GRAPH_METRICS else "cpu"
+        self.live = True
+    def press_center_callback(self, disp_info: DisplayInfo, draw: PIL.ImageDraw, ipc: 'IPC') -> Union[Any, None]:
+        return self.root
+    def press_left_callback(self, disp_info: DisplayInfo, draw: PIL.ImageDraw, ipc: 'IPC') -> Union[Any, None]:
+        return self.root
+    def render(self, disp_info: DisplayInfo, draw: PIL.ImageDraw, ipc: 'IPC') -> Any:
+        values = disp_info.history.latest(self.metric, disp_info.line_width) if disp_info.history else np.zeros(0)
+        draw_graph(draw, disp_info.text_cache, disp_info.font, self.metric, values, disp_info.line_width, disp_info.height)
         return self
 
 class Variable(Item):
@@ -163,15 +210,18 @@ class Variable(Item):
         self.lhs_display = self.name
         self.rhs_display = str(self.value) if self.value != None else ""
     def update_value(self, value: Union[Any, None] = None, change: Union[Any, None] = None) -> None:
+        # computed aside, a value the step cannot apply to leaves the variable unchanged
+        new_value = self.value
         if value != None:
-            self.value = value
+            new_value = value
         elif change != None:
             if self.step != None:
-                self.value += self.step*change
-            elif isinstance(self.value, bool):
-                self.value = not self.value
+                new_value += self.step*change
+            elif isinstance(new_value, bool):
+                new_value = not new_value
         if self.step_exponent != None:
-            self.value = round(self.value, self.step_exponent)
+            new_value = round(new_value, self.step_exponent)
+        self.value = new_value
         self.rhs_display = str(self.value)
     def press_center_callback(self, disp_info: DisplayInfo, draw: PIL.ImageDraw, ipc: 'IPC') -> Union[Any, None]:
         # User accept result, send the value back to client
@@ -187,27 +237,63 @@ class Variable(Item):
         self.update_value(change=1)
     def render(self, disp_info: DisplayInfo, draw: PIL.ImageDraw, ipc: 'IPC') -> Any:
         x = (disp_info.line_width - len(self.name) * disp_info.font_width) // 2
-        draw.text((x, 2), self.name, font=disp_info.font, fill=255)
+        disp_info.text(draw, (x, 2), self.name)
         value_str = "<<  " + str(self.value) + "  >>"
         x = (disp_info.line_width - len(value_str) * disp_info.font_width) // 2
-        draw.text((x, 16), value_str,  font=disp_info.font, fill=255)
+        disp_info.text(draw, (x, 16), value_str)
         return self
 
-class Function(Menu):
-    def __init__(self, root: Union[Any, None] = None, name: str = "", uuid: str = "") -> None:
+class Console(Menu):
+    '''
+    Menu followed by a fixed capacity ring of text lines, lines are plain strings and not indexed items
+    '''
+    def __init__(self, root: Union[Any, None] = None, name: str = "", uuid: str = "", capacity: int = CONSOLE_CAPACITY) -> None:
         super().__init__(root=root, name=name, uuid=uuid)
+        self.lines: collections.deque = collections.deque(maxlen=max(int(capacity), 1))
+        self.lines_first: bool = False
+    def append_lines(self, lines: List[str]) -> None:
+        follow = self.select_idx >= self.row_count()-1
+        self.lines.extend(lines)
+        if follow:
+            # keep the cursor on the newest line, like a terminal
+            self.select_idx = self.row_count()-1
+    def reset(self) -> None:
+        super().reset()
+        self.lines.clear()
+    def row_count(self) -> int:
+        return len(self.lines) + len(self.obj_list)
+    def row(self, idx: int) -> Tuple[str, str]:
+        item_idx = self.item_idx(idx)
+        if item_idx is not None:
+            return self.obj_list[item_idx].get_display_info()
+        return self.lines[idx - len(self.obj_list) if not self.lines_first else idx], ""
+    def item_idx(self, idx: int) -> Union[int, None]:
+        if self.lines_first:
+            idx -= len(self.lines)
+        return idx if 0 <= idx < len(self.obj_list) else None
+    def press_center_callback(self, disp_info: DisplayInfo, draw: PIL.ImageDraw, ipc: 'IPC') -> Union[Item, None]:
+        item_idx = self.item_idx(self.select_idx)
+        return self.obj_list[item_idx] if item_idx is not None else None
+
+class Function(Console):
+    def __init__(self, root: Union[Any, None] = None, name: str = "", uuid: str = "", capacity: int = CONSOLE_CAPACITY) -> None:
+        super().__init__(root=root, name=name, uuid=uuid, capacity=capacity)
         self.obj_list = []
+        self.lines_first = True
         self.callback_running: bool = False
         self.lhs_display = "[ {name} ]".format(name=self.name)
     def add(self, obj):
         super().add(obj)
-        self.select_idx = len(self.obj_list)-1
+        self.select_idx = self.row_count()-1
     def add_finish_return(self):
         return_item: Return = Return(root=self, display="<< completed, return", callback=self.reset)
         self.add(return_item)
     def reset(self):
         self.callback_running = False
+        for o in self.obj_list:
+            self.index.unregister(o)
         self.obj_list = []
+        self.lines.clear()
     def display(self, disp_info: DisplayInfo, draw: PIL.ImageDraw, action: SwitchAction, ipc: 'IPC') -> Any:
         if not self.callback_running:
             self.reset()
@@ -218,14 +304,22 @@ class Function(Menu):
 class IPCPacket:
     def __init__(self, json_str: Union[str, None] = None, action: Union[str, None] = None, args: list = [], kwargs: dict = {}) -> None:
         if json_str != None:
-            packet = json.loads(json_str)
-            self.action = packet['action']
-            self.args = packet['args']
-            self.kwargs = packet['kwargs']
+            self.action, self.args, self.kwargs = decode_json(json_str)
         elif action != None:
             self.action = action
             self.args = args
             self.kwargs = kwargs
+    @staticmethod
+    def decode(data: bytes, version: int = PROTOCOL_JSON) -> 'IPCPacket':
+        if version == PROTOCOL_JSON:
+            action, args, kwargs = decode_json(data)
+        else:
+            action, args, kwargs = decode_binary(data)
+        return IPCPacket(action=action, args=args, kwargs=kwargs)
+    def encode(self, version: int = PROTOCOL_JSON) -> bytes:
+        if version == PROTOCOL_JSON:
+            return encode_json(self.action, self.args, self.kwargs)
+        return encode_binary(self.action, self.args, self.kwargs)
     def stringify(self) -> str:
         packet = {'action': self.action,
                   'args': self.args,
@@ -233,39 +327,147 @@ class IPCPacket:
         return json.dumps(packet)
 
 class IPCConnection:
-    def __init__(self, connection: socket.socket, blocking: bool = False) -> None:
+    def __init__(self, connection: socket.socket, blocking: bool = False, chunk_size: int = 65536, recv_limit: int = 4 << 20) -> None:
+        '''
+        chunk_size: bytes requested by each recv_into call
+        recv_limit: max bytes drained from the socket by one recv call, so a busy peer cannot starve the others
+        '''
         self.connection = connection
         self.connection.setblocking(blocking)
-        self.recv_data = bytes([])
+        self.chunk_size = chunk_size
+        self.recv_limit = recv_limit
+        # received data lives in recv_buffer[recv_start:recv_end], parsed frames only move recv_start,
+        # the unparsed tail is moved to the front once in a while instead of after every packet
+        self.recv_buffer = bytearray(2 * chunk_size)
+        self.recv_view = memoryview(self.recv_buffer)
+        self.recv_start = 0
+        self.recv_end = 0
+        self.closed = False
+        # every connection starts with the JSON protocol, a hello handshake switches both sides
+        self.version: int = PROTOCOL_JSON
+        self.handshake_pending: bool = False
+        self.server_side: bool = False      # set by announce(), hello packets are then requests to answer
+        self.server_version: Union[int, None] = None    # announced by the server, None for servers without handshake
+        self.send_lock = threading.Lock()   # one sender at a time, the version may change in between
+    def _make_room(self, size: int) -> None:
+        pending = self.recv_end - self.recv_start
+        if len(self.recv_buffer) - pending < size:
+            # grow, the old view has to be released before the buffer can be dropped
+            buffer = bytearray(max(2 * len(self.recv_buffer), pending + size))
+            buffer[:pending] = self.recv_view[self.recv_start:self.recv_end]
+            self.recv_view.release()
+            self.recv_buffer = buffer
+            self.recv_view = memoryview(buffer)
+        else:
+            # same size slice assignment, allowed while the view is exported
+            self.recv_buffer[:pending] = self.recv_buffer[self.recv_start:self.recv_end]
+        self.recv_start = 0
+        self.recv_end = pending
+    def _fill(self) -> None:
+        # the first read may block (client connection), then drain without waiting until EAGAIN
+        flags = 0
+        received = 0
+        while received < self.recv_limit:
+            if len(self.recv_buffer) - self.recv_end < self.chunk_size:
+                self._make_room(self.chunk_size)
+            try:
+                n = self.connection.recv_into(self.recv_view[self.recv_end:], self.chunk_size, flags)
+            except BlockingIOError:
+                # no client send data
+                break
+            except OSError:
+                self.closed = True
+                break
+            if n == 0:
+                self.closed = True
+                break
+            self.recv_end += n
+            received += n
+            flags = socket.MSG_DONTWAIT
     def recv(self) -> List[IPCPacket]:
-        try:
-            data = self.connection.recv(1024)
-            if data:
-                self.recv_data += data
-        except BlockingIOError:
-            # no client send data
-            pass
+        self._fill()
         recv_packets: list[IPCPacket] = []
-        # first two byte is the packet length, big endian, after that is json string
-        data_len = len(self.recv_data)
-        while data_len > 2:
-            packet_len = self.recv_data[0] | (self.recv_data[1]<<8)
-            if data_len - 2 >= packet_len:
-                recv_packets.append(IPCPacket(json_str=self.recv_data[2:packet_len+2].decode()))
-                self.recv_data = self.recv_data[packet_len+2:]  # remove processed data
-                data_len = len(self.recv_data)    # update remaining data length
-            else:
+        view = self.recv_view
+        offset = self.recv_start
+        # each packet is prefixed by its length, little endian, 2 bytes for JSON and 4 bytes for binary protocol
+        while True:
+            header_size = HEADER_SIZE[self.version]
+            if self.recv_end - offset < header_size:
+                break
+            packet_len = frame_length(view, offset, self.version)
+            if self.recv_end - offset - header_size < packet_len:
                 break
+            offset += header_size
+            try:
+                with timings.measure('ipc.decode'):
+                    packet = IPCPacket.decode(bytes(view[offset:offset+packet_len]), self.version)
+                if not (isinstance(packet.action, str) and isinstance(packet.args, list) and isinstance(packet.kwargs, dict)):
+                    raise ValueError('malformed packet')
+                if packet.action == 'hello':
+                    # the following packets may already use the negotiated protocol
+                    self.handle_hello(packet)
+                elif not self.server_side and announced_version(packet.action, packet.kwargs) is not None:
+                    self.server_version = min(announced_version(packet.action, packet.kwargs), PROTOCOL_VERSION)
+                else:
+                    recv_packets.append(packet)
+            except Exception:
+                # malformed frame, the rest of the stream cannot be trusted, the owner drops the connection
+                self.closed = True
+                offset = self.recv_end
+                break
+            offset += packet_len
+        self.recv_start = offset
+        if self.recv_start == self.recv_end:
+            self.recv_start = self.recv_end = 0
         return recv_packets
+    def handle_hello(self, packet: IPCPacket) -> None:
+        version = min(int(packet.kwargs.get('version', PROTOCOL_JSON)), PROTOCOL_VERSION)
+        with self.send_lock:
+            if self.server_side:
+                # hello request from a client, answer using the current protocol before switching
+                self._send([IPCPacket(action='hello', kwargs={'version': version})])
+                self.version = version
+            elif self.handshake_pending:
+                # answer to our request, the following packets use the negotiated protocol
+                self.handshake_pending = False
+                self.version = version
+    def announce(self) -> None:
+        '''
+        Server side, tell a new client the protocol versions this server speaks. Servers predating the
+        handshake stay silent and reject hello packets, so clients only send one after this announcement.
+        '''
+        self.server_side = True
+        action, kwargs = announcement()
+        self.send([IPCPacket(action=action, kwargs=kwargs)])
+    def _wait(self, done: Callable[[], bool], deadline: float) -> None:
+        while not done() and not self.closed:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            readable, _, _ = select.select([self.connection], [], [], remaining)
+            if readable:
+                self.recv()
+    def hello(self, timeout: float = 1.0) -> int:
+        '''
+        Client side protocol negotiation, blocks until the server announced itself and answered, or timeout.
+        return negotiated protocol version, PROTOCOL_JSON if the server does not announce a newer one
+        '''
+        deadline = time.monotonic() + timeout
+        self._wait(lambda: self.server_version is not None, deadline)
+        if self.server_version is not None and self.server_version > PROTOCOL_JSON:
+            self.handshake_pending = True
+            self.send([IPCPacket(action='hello', kwargs={'version': PROTOCOL_VERSION})])
+            self._wait(lambda: not self.handshake_pending, deadline)
+            self.handshake_pending = False
+        return self.version
     def send(self, packets: List[IPCPacket]) -> bool:
         '''
         return status of sending packets
         '''
-        send_data = bytes([])
-        for packet in packets:
-            packet_bytes = packet.stringify().encode()
-            packet_len = len(packet_bytes)
-            send_data += bytes([packet_len&0xFF, (packet_len>>8)&0xFF]) + packet_bytes
+        with self.send_lock:
+            return self._send(packets)
+    def _send(self, packets: List[IPCPacket]) -> bool:
+        send_data = b''.join([frame(packet.encode(self.version), self.version) for packet in packets])
         try:
             self.connection.sendall(send_data)
             return True
@@ -273,8 +475,19 @@ class IPCConnection:
             return False
 
 class IPC:
-    def __init__(self, address: str) -> None:
+    '''
+    Menu socket server. start() runs a selector loop on its own thread which accepts, reads and
+    decodes as soon as data arrives, the packets are queued for the render thread and `wakeup` is set.
+    Without the thread, recv() polls the sockets inline.
+    '''
+    def __init__(self, address: str, chunk_size: int = 65536, wakeup: Union[threading.Event, None] = None) -> None:
         self.address: str = address
+        self.chunk_size = chunk_size
+        self.wakeup = wakeup if wakeup is not None else threading.Event()
+        self.inbox: 'queue.Queue[IPCPacket]' = queue.Queue()
+        self.lock = threading.Lock()    # protects connections, shared by the reactor and the render thread
+        self.thread: Union[threading.Thread, None] = None
+        self.running = False
         try:
             os.remove(self.address)
         except OSError:
@@ -282,68 +495,180 @@ class IPC:
         self.socket: socket.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
         self.socket.bind(self.address)
         os.chmod(self.address, 0o777)   # giving permission such that non root user can still connect to this socket
-        self.socket.listen(1)
+        self.socket.listen(8)
         self.socket.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.socket, selectors.EVENT_READ, None)
         self.reset()
     def reset(self) -> None:
-        self.connections: list[IPCConnection] = []
-    def recv(self) -> List[IPCPacket]:
+        with self.lock:
+            for conn in getattr(self, 'connections', []):
+                self.selector.unregister(conn.connection)
+            self.connections: list[IPCConnection] = []
+    def start(self) -> None:
+        if self.thread is None:
+            self.running = True
+            self.thread = threading.Thread(target=self.serve, name='menu-ipc', daemon=True)
+            self.thread.start()
+    def stop(self) -> None:
+        '''
+        Stop the reactor, close every client connection and the listening socket, clients see EOF and reconnect
+        '''
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        # stop accepting first, a client reconnecting right away must not land in the dead backlog
+        self.socket.close()
+        try:
+            os.remove(self.address)
+        except OSError:
+            pass
+        with self.lock:
+            for conn in self.connections:
+                conn.connection.close()
+            self.connections = []
+        self.selector.close()
+    def serve(self) -> None:
+        while self.running:
+            self.poll(timeout=0.5)
+    def poll(self, timeout: Union[float, None] = 0) -> int:
+        '''
+        Handle every ready socket once, return number of packets queued
+        '''
+        queued = 0
+        for key, _ in self.selector.select(timeout):
+            if key.data is None:
+                self._accept()
+                continue
+            conn: IPCConnection = key.data
+            for packet in conn.recv():
+                self.inbox.put(packet)
+                queued += 1
+            if conn.closed:
+                self._drop(conn)
+        if queued:
+            self.wakeup.set()
+        return queued
+    def _accept(self) -> None:
         try:
-            conn, addr = self.socket.accept()
-            self.connections.append(IPCConnection(conn))
+            while True:
+                conn, addr = self.socket.accept()
+                ipc_conn = IPCConnection(conn, chunk_size=self.chunk_size)
+                ipc_conn.announce()
+                with self.lock:
+                    self.connections.append(ipc_conn)
+                    self.selector.register(conn, selectors.EVENT_READ, ipc_conn)
         except BlockingIOError:
             pass
+    def _drop(self, conn: IPCConnection) -> None:
+        with self.lock:
+            if conn in self.connections:
+                self.connections.remove(conn)
+                self.selector.unregister(conn.connection)
+                conn.connection.close()
+    def recv(self) -> List[IPCPacket]:
+        '''
+        return the packets received since the last call, never blocks
+        '''
+        if self.thread is None:
+            self.poll()
         recv_packets: list[IPCPacket] = []
-        for conn in self.connections:
-            recv_packets += conn.recv()
-        return recv_packets
+        while True:
+            try:
+                recv_packets.append(self.inbox.get_nowait())
+            except queue.Empty:
+                return recv_packets
     def send(self, packets: List[IPCPacket]) -> None:
+        with self.lock:
+            connections = list(self.connections)
         broken_list = []
-        for conn in self.connections:
+        for conn in connections:
             if conn.send(packets) == False:
                 broken_list.append(conn)
         # clean up broken connection
         for broken in broken_list:
-            self.connections.remove(broken)
+            self._drop(broken)
 
 class DisplayServer(object):
     
-    def __init__(self, *args, **kwargs):
-        self.display = Adafruit_SSD1306.SSD1306_128_32(rst=None, i2c_bus=7, gpio=1) 
+    def __init__(self, *args, display: Any = None, gpio: Any = None, jtop_factory: Any = None,
+                 menu_address: str = '/tmp/menu_socket', **kwargs):
+        '''
+        display, gpio, jtop_factory: hardware access, the board devices by default (see jetcard.hardware for fakes)
+        '''
+        self.display = display if display is not None else default_display()
         self.display.begin()
         self.display.clear()
         self.display.display()
+        self.frame_pusher = FramePusher(self.display)
+        # display() above already cleared the panel, diff against a blank frame instead of sending it again
+        self.frame_pusher.last_frame = np.zeros(self.display.width * self.display.height // 8, dtype=np.uint8)
         self.font = PIL.ImageFont.load_default()
+        self.text_cache = TextCache()
         self.image = PIL.Image.new('1', (self.display.width, self.display.height))
         self.draw = PIL.ImageDraw.Draw(self.image)
         self.draw.rectangle((0, 0, self.image.width, self.image.height), outline=0, fill=0)
+        # the IP address goes on the panel before GPIO, jtop, the menu socket and Flask are started
+        self.procfs = ProcfsBackend()
+        self.render_stats(StatsSnapshot())
+        self.push_frame()
+        self.first_frame = time.monotonic()
         self.stats_enabled = False
-        self.stats_thread = None
+        self.running = False
+        self.display_thread = None
+        self.commands: 'queue.Queue[Tuple[Any, tuple]]' = queue.Queue()    # calls posted by HTTP handlers
         self.stats_interval = 1.0
+        self.sampler = JtopSampler(interval=self.stats_interval, jtop_factory=jtop_factory or default_jtop_factory)
+        self.history = MetricsHistory()
+        self.sampler.subscribe(self.history.record)
+        self.broadcast = SnapshotBroadcast()
+        self.sampler.subscribe(self.broadcast.publish)
+        self.exporter = MetricsExporter(self.sampler, self.health_counters)
+        self.packets_handled = 0
+        self.sampler.start()
+        self.stats_pages = ['stats'] + list(GRAPH_METRICS)     # cycled with left / right on the stats screen
+        self.stats_page = 0
         # init for quick menu
-        self.disp_info = DisplayInfo(self.image.width, self.image.height, self.font, 6, 8)
+        self.disp_info = DisplayInfo(self.image.width, self.image.height, self.font, 6, 8, self.text_cache, self.history)
         self.root_menu = Menu()
         self.menu_ptr = self.root_menu
         self.menu_on = False
         self.das_count = 0
         self.das_action = SwitchAction.PRESS_NOTHING
-        GPIO.setmode(GPIO.BOARD)
-        GPIO.setup(UP_CHANNEL, GPIO.IN)
-        GPIO.setup(RIGHT_CHANNEL, GPIO.IN)
-        GPIO.setup(LEFT_CHANNEL, GPIO.IN)
-        GPIO.setup(DOWN_CHANNEL, GPIO.IN)
-        GPIO.setup(CENTER_CHANNEL, GPIO.IN)
-        GPIO.add_event_detect(UP_CHANNEL, GPIO.RISING, bouncetime=200)
-        GPIO.add_event_detect(RIGHT_CHANNEL, GPIO.RISING, bouncetime=200)
-        GPIO.add_event_detect(LEFT_CHANNEL, GPIO.RISING, bouncetime=200)
-        GPIO.add_event_detect(DOWN_CHANNEL, GPIO.RISING, bouncetime=200)
-        GPIO.add_event_detect(CENTER_CHANNEL, GPIO.RISING, bouncetime=200)
-        self.ipc = IPC('/tmp/menu_socket')
+        # set by button presses and incoming IPC packets to wake the render loop up
+        self.wakeup = threading.Event()
+        self.buttons = ButtonInput(gpio, wakeup=self.wakeup)
+        self.input_latency = 0.0    # seconds from the last button edge to its frame being pushed
+        # menu frames are only rendered when something changed, and paced slower once idle
+        self.dirty = True
+        self.active_interval = 0.05
+        self.idle_interval = 0.5
+        self.idle_after = 1.0       # seconds without input before switching to idle_interval
+        self.last_input = 0.0
+        self.stats_generation = -1  # sampler generation shown on the stats screen
+        self.frames_rendered = 0
+        self.renders_skipped = 0
+        self.frame_times: collections.deque = collections.deque(maxlen=256)
+        # every part of the display loop runs at its own rate, presses and IPC packets run input and ipc right away
+        self.ipc_interval = 0.1
+        self.render_interval = 0.05
+        self.scheduler = Scheduler(self.wakeup, wake=['control', 'input', 'ipc'])
+        self.scheduler.add('control', 1.0, self.run_commands)
+        self.scheduler.add('input', self.active_interval, self.poll_input)
+        self.scheduler.add('ipc', self.ipc_interval, self.process_packets)
+        self.scheduler.add('render', self.render_interval, self.render_task)
+        self.scheduler.add('sampling', self.stats_interval, self.sampling_task)
+        self.ipc = IPC(menu_address, wakeup=self.wakeup)
         self.actions = {
             'reset_menu': self.reset_menu,
             'create_item': self.create_item,
-            'update_value': self.update_value
+            'create_tree': self.create_tree,
+            'update_value': self.update_value,
+            'append_lines': self.append_lines
         }
+        self.ipc.start()
+        self.start()
         self.enable_stats()
         
     def reset_menu(self, *args, uuid: Union[str, None] = None, **kwargs) -> None:
@@ -354,7 +679,7 @@ class DisplayServer(object):
             self.menu_ptr = self.root_menu
         elif isinstance(ptr, Menu):
             # make sure the menu_ptr is not inside the reset item set
-            if ptr != self.menu_ptr and ptr.find(self.menu_ptr.uuid) != None:
+            if ptr != self.menu_ptr and ptr.contains(self.menu_ptr):
                 self.menu_ptr = ptr
             ptr.reset()
 
@@ -363,10 +688,17 @@ class DisplayServer(object):
         CREATE_TYPE = {'item': Item,
                        'menu': Menu,
                        'func': Function,
+                       'console': Console,
+                       'graph': Graph,
                        'var': Variable}
         if isinstance(root_ptr, Menu) and create_type in CREATE_TYPE:
             root_ptr.add(CREATE_TYPE[create_type](*args, root=root_ptr, **kwargs))
 
+    def create_tree(self, *args, items: List[dict] = [], **kwargs) -> None:
+        # items are in creation order, a root is always created before its children
+        for item in items:
+            self.create_item(**item)
+
     def update_value(self, *args, uuid: Union[str, None] = None, value: Any = True, **kwargs) -> None:
         ptr = self.root_menu.find(uuid)
         if isinstance(ptr, Function):
@@ -379,173 +711,431 @@ class DisplayServer(object):
         elif isinstance(ptr, Variable):
             ptr.update_value(value)
 
-    def _run_display_stats(self):
-        while self.stats_enabled:
-            packets = self.ipc.recv()
-            for packet in packets:
-                self.actions[packet.action](*packet.args, **packet.kwargs)
-            if self.menu_on:
-                self.draw.rectangle((0, 0, self.image.width, self.image.height), outline=0, fill=0)
-                action = SwitchAction.PRESS_NOTHING
-                if GPIO.event_detected(UP_CHANNEL):
-                    action = SwitchAction.PRESS_UP
-                if GPIO.event_detected(RIGHT_CHANNEL):
-                    action = SwitchAction.PRESS_RIGHT
-                if GPIO.event_detected(LEFT_CHANNEL):
-                    action = SwitchAction.PRESS_LEFT
-                if GPIO.event_detected(DOWN_CHANNEL):
-                    action = SwitchAction.PRESS_DOWN
-                if GPIO.event_detected(CENTER_CHANNEL):
-                    action = SwitchAction.PRESS_CENTER
-                if action == SwitchAction.PRESS_NOTHING:
-                    checked_action = SwitchAction.PRESS_NOTHING
-                    if GPIO.input(UP_CHANNEL) == GPIO.HIGH:
-                        checked_action = SwitchAction.PRESS_UP
-                    elif  GPIO.input(DOWN_CHANNEL) == GPIO.HIGH:
-                        checked_action = SwitchAction.PRESS_DOWN
-                    elif GPIO.input(LEFT_CHANNEL) == GPIO.HIGH:
-                        checked_action = SwitchAction.PRESS_LEFT
-                    elif GPIO.input(RIGHT_CHANNEL) == GPIO.HIGH:
-                        checked_action = SwitchAction.PRESS_RIGHT
-                    if checked_action != self.das_action:
-                        self.das_count = 0
-                        self.das_action = checked_action
-                    elif checked_action != SwitchAction.PRESS_NOTHING:
-                        self.das_count += 1
-                    if self.das_count > 5:
-                        self.das_count = 6
-                        action = self.das_action
-                self.menu_ptr = self.menu_ptr.display(self.disp_info, self.draw, action, self.ipc)
-                self.display.image(self.image)
-                self.display.display()
-                if self.menu_ptr == None:
-                    self.menu_on = False
-                    self.menu_ptr = self.root_menu
-                time.sleep(0.05)
-            else:
+    def append_lines(self, *args, uuid: Union[str, None] = None, lines: List[str] = [], **kwargs) -> None:
+        ptr = self.root_menu.find(uuid)
+        if isinstance(ptr, Console):
+            ptr.append_lines(lines)
+
+    def process_packets(self) -> int:
+        packets = self.ipc.recv()
+        for packet in packets:
+            action = self.actions.get(packet.action)
+            if action is None:
+                # sent by a newer client, or a custom action this server does not know
+                continue
+            try:
+                with timings.measure('ipc.' + packet.action):
+                    action(*packet.args, **packet.kwargs)
+            except Exception as e:
+                # bad arguments from one client must not stop the display thread, the packet is skipped
+                print('menu packet %s failed: %r' % (packet.action, e), file=sys.stderr)
+        self.packets_handled += len(packets)
+        if packets:
+            # any menu packet may change what is on screen
+            self.mark_dirty()
+        return len(packets)
+
+    def mark_dirty(self) -> None:
+        self.dirty = True
+        self.scheduler.trigger('render')
+
+    def set_interval(self, task: str, interval: float) -> None:
+        '''
+        Change the rate of one display loop task: 'input', 'ipc', 'render' or 'sampling'
+        '''
+        if task == 'input':
+            self.active_interval = interval
+        elif task == 'render':
+            self.render_interval = interval
+        elif task == 'sampling':
+            # the screen checks for new samples as often as jtop produces them
+            self.stats_interval = interval
+            self.sampler.set_interval(interval)
+        self.scheduler.set_interval(task, interval)
+
+    def health_counters(self) -> list:
+        '''
+        return the daemon counters exported on /metrics as (name, type, help, value)
+        '''
+        pusher = self.frame_pusher
+        return [('jetcard_frames_pushed', 'counter', 'Frames which caused a display transfer.', pusher.frames_pushed),
+                ('jetcard_frames_skipped', 'counter', 'Frames identical to the panel content.', pusher.frames_skipped),
+                ('jetcard_frames_rendered', 'counter', 'Frames drawn by the display loop.', self.frames_rendered),
+                ('jetcard_display_bytes', 'counter', 'Bytes written to the display.', pusher.bytes_sent),
+                ('jetcard_ipc_messages', 'counter', 'Menu IPC packets handled.', self.packets_handled),
+                ('jetcard_ipc_clients', 'gauge', 'Connected menu clients.', len(self.ipc.connections)),
+                ('jetcard_sampler_samples', 'counter', 'Snapshots published by the sampler.', self.sampler.generation),
+                ('jetcard_sampler_errors', 'counter', 'Failed jtop connections or samples.', self.sampler.errors),
+                ('jetcard_stream_subscribers', 'gauge', 'Open /stats/stream connections.', self.broadcast.subscribers),
+                ('jetcard_input_latency_seconds', 'gauge', 'Last button edge to frame pushed.', self.input_latency),
+                ('jetcard_display_fps', 'gauge', 'Frames rendered over the last second.', self.effective_fps())]
+
+    def effective_fps(self, window: float = 1.0) -> float:
+        '''
+        return the number of frames rendered per second over the last window seconds
+        '''
+        since = time.monotonic() - window
+        return sum(1 for t in self.frame_times if t >= since) / window
+
+    def start(self) -> None:
+        if not self.running:
+            self.running = True
+            self.display_thread = threading.Thread(target=self._run_display, name='display')
+            self.display_thread.start()
+
+    def stop(self) -> None:
+        self.running = False
+        self.wakeup.set()
+        if self.display_thread is not None:
+            self.display_thread.join()
+        self.sampler.stop()
+        self.ipc.stop()
+
+    def _run_display(self):
+        # the only thread drawing and pushing frames, other threads post() their requests
+        self.scheduler.run(lambda: self.running)
+
+    def post(self, func, *args) -> None:
+        '''
+        Run func(*args) on the display thread, returns immediately
+        '''
+        self.commands.put((func, args))
+        self.wakeup.set()
+
+    def run_commands(self) -> None:
+        while True:
+            try:
+                func, args = self.commands.get_nowait()
+            except queue.Empty:
+                return
+            func(*args)
+
+    def poll_input(self) -> None:
+        if not self.stats_enabled:
+            # the screen belongs to set_text, presses are ignored
+            self.buttons.clear()
+            self.pace(idle=True)
+            return
+        event = self.buttons.get()
+        if not self.menu_on:
+            while event is not None:
+                if event.action == SwitchAction.PRESS_CENTER:
+                    # ignore everything pressed before entering the menu
+                    self.buttons.clear()
+                    self.menu_on = True
+                    self.last_input = time.monotonic()
+                    self.mark_dirty()
+                    break
+                if event.action in (SwitchAction.PRESS_LEFT, SwitchAction.PRESS_RIGHT):
+                    step = 1 if event.action == SwitchAction.PRESS_RIGHT else -1
+                    self.show_stats_page((self.stats_page + step) % len(self.stats_pages))
+                event = self.buttons.get()
+            # presses wake the loop up, no need to poll quickly outside the menu
+            self.pace(idle=not self.menu_on)
+            return
+        action = event.action if event else SwitchAction.PRESS_NOTHING
+        if action == SwitchAction.PRESS_NOTHING:
+            checked_action = self.buttons.held_action()
+            if checked_action != self.das_action:
+                self.das_count = 0
+                self.das_action = checked_action
+            elif checked_action != SwitchAction.PRESS_NOTHING:
+                self.das_count += 1
+            if self.das_count > 5:
+                self.das_count = 6
+                action = self.das_action
+        if action != SwitchAction.PRESS_NOTHING:
+            self.last_input = time.monotonic()
+            self.render_menu(action, event)
+        if not self.buttons.events.empty():
+            # one press per frame, handle the next one on the following pass
+            self.scheduler.trigger('input')
+        # poll held buttons quickly after input, slow down once idle
+        self.pace(idle=self.das_action == SwitchAction.PRESS_NOTHING and time.monotonic() - self.last_input > self.idle_after)
+
+    def pace(self, idle: bool) -> None:
+        self.scheduler.set_interval('input', self.idle_interval if idle else self.active_interval)
+        self.scheduler.set_interval('render', self.idle_interval if idle else self.render_interval)
+
+    def render_task(self) -> None:
+        if not self.stats_enabled or not self.menu_on:
+            return
+        if self.dirty:
+            self.render_menu()
+        else:
+            self.renders_skipped += 1
+
+    def render_menu(self, action: SwitchAction = SwitchAction.PRESS_NOTHING, event: Union[ButtonEvent, None] = None) -> None:
+        self.dirty = False
+        while True:
+            self.draw.rectangle((0, 0, self.image.width, self.image.height), outline=0, fill=0)
+            with timings.measure('draw.menu'):
+                menu_ptr = self.menu_ptr.display(self.disp_info, self.draw, action, self.ipc)
+            action = SwitchAction.PRESS_NOTHING
+            if menu_ptr is None:
+                self.menu_on = False
+                self.menu_ptr = self.root_menu
+                self.stats_generation = -1
+                self.scheduler.trigger('sampling')
+                return
+            if menu_ptr is self.menu_ptr:
+                break
+            # moved to another screen, nothing was drawn yet, render it right away
+            self.menu_ptr = menu_ptr
+        self.push_frame()
+        self.frames_rendered += 1
+        self.frame_times.append(time.monotonic())
+        if event:
+            self.input_latency = time.monotonic() - event.timestamp
+
+    def show_stats_page(self, page: int) -> None:
+        self.stats_page = page
+        self.stats_generation = -1
+        self.scheduler.trigger('sampling')
+
+    def sampling_task(self) -> None:
+        if not self.stats_enabled:
+            return
+        generation = self.sampler.generation
+        if self.menu_on:
+            if self.menu_ptr.live and generation != self.stats_generation:
+                self.stats_generation = generation
+                self.mark_dirty()
+            return
+        if generation == self.stats_generation:
+            self.renders_skipped += 1
+            return
+        self.stats_generation = generation
+        page = self.stats_pages[self.stats_page]
+        if page == 'stats':
+            with timings.measure('draw.stats'):
+                self.render_stats(self.sampler.snapshot)
+        else:
+            with timings.measure('draw.graph'):
                 self.draw.rectangle((0, 0, self.image.width, self.image.height), outline=0, fill=0)
+                draw_graph(self.draw, self.text_cache, self.font, page, self.history.latest(page, self.image.width),
+                           self.image.width, self.image.height)
+        self.push_frame()
+        self.frames_rendered += 1
+        self.frame_times.append(time.monotonic())
+
+    def render_stats(self, stats: StatsSnapshot) -> None:
+        self.draw.rectangle((0, 0, self.image.width, self.image.height), outline=0, fill=0)
+        if stats.available:
+            ip_address = 'IP: ' + (stats.ip_address if stats.ip_address else 'not available')
+            power_mode = stats.power_mode
+            power_watts = f"{int(stats.power_watts):2}W"
+            gpu_percent = f"{int(stats.gpu_percent):2}%"
+            cpu_percent = f"{int(stats.cpu_percent):2}%"
+            ram_percent = f"{int(stats.ram_percent):2}%"
+            disk_percent = f"{int(stats.disk_percent):2}%"
+        else:
+            # no jtop sample yet, the address is still useful to connect to the board
+            ip_address = 'IP: ' + (self.local_ip() or 'not available')
+            power_mode = '0W'
+            power_watts = '00W'
+            gpu_percent = '00%'
+            cpu_percent = '00%'
+            ram_percent = '00%'
+            disk_percent = '00%'
+
+        # set IP address
+        top = -2
+        self.text_cache.draw_text(self.draw, (4, top), ip_address, self.font)
+        
+        top = 6
+        power_mode_str = power_mode
+        self.text_cache.draw_text(self.draw, (4, top), 'MODE: ' + power_mode_str, self.font)
+        
+        # set stats headers
+        top = 14
+        offset = 3 * 8
+        headers = ['PWR', 'CPU', 'GPU', 'RAM', 'DSK']
+        for i, header in enumerate(headers):
+            self.text_cache.draw_text(self.draw, (i * offset + 4, top), header, self.font)
+
+        # set stats fields
+        top = 22
+        entries = [power_watts, cpu_percent, gpu_percent, ram_percent, disk_percent]
+        for i, entry in enumerate(entries):
+            self.text_cache.draw_text(self.draw, (i * offset + 4, top), entry, self.font)
+
+    def local_ip(self) -> Union[str, None]:
+        for interface in IP_INTERFACES:
+            address = self.procfs.ip_address(interface)
+            if address:
+                return address
+        return None
 
-                try:
-                    with jtop() as jetson:
-                        ip_addrs = jetson.local_interfaces['interfaces']
-                        if 'eth0' in ip_addrs:
-                            ip_address = 'IP: ' + str(ip_addrs['eth0'])
-                        elif 'eth0:avahi' in ip_addrs:
-                            ip_address = 'IP: ' + str(ip_addrs['eth0:avahi'])
-                        elif 'wlan0' in ip_addrs:
-                            ip_address = 'IP: ' + str(ip_addrs['wlan0'])
-                        else:
-                            ip_address = 'IP: not available'
-                        power_mode = str(jetson.nvpmodel)
-                        power_watts = f"{int(jetson.power['tot']['power']/1000):2}W"
-                        gpu_percent = f"{int(jetson.gpu['ga10b']['status']['load']):2}%"
-                        cpu_percent = f"{int(100 - jetson.cpu['total']['idle']):2}%"
-                        ram_percent = f"{int(jetson.memory['RAM']['used']/jetson.memory['RAM']['tot']*100):2}%"
-                        disk_percent = f"{int(jetson.disk['used']/jetson.disk['total']*100):2}%"
-                        
-                except Exception as e:
-                    ip_address = 'IP: not available'
-                    power_mode = '0W'
-                    power_watts = '00W'
-                    gpu_percent = '00%'
-                    cpu_percent = '00%'
-                    ram_percent = '00%'
-                    disk_percent = '00%'
-                
-                # set IP address
-                top = -2
-                self.draw.text((4, top), ip_address, font=self.font, fill=255)
-                
-                top = 6
-                power_mode_str = power_mode
-                self.draw.text((4, top), 'MODE: ' + power_mode_str, font=self.font, fill=255)
-                
-                # set stats headers
-                top = 14
-                offset = 3 * 8
-                headers = ['PWR', 'CPU', 'GPU', 'RAM', 'DSK']
-                for i, header in enumerate(headers):
-                    self.draw.text((i * offset + 4, top), header, font=self.font, fill=255)
-
-                # set stats fields
-                top = 22
-                entries = [power_watts, cpu_percent, gpu_percent, ram_percent, disk_percent]
-                for i, entry in enumerate(entries):
-                    self.draw.text((i * offset + 4, top), entry, font=self.font, fill=255)
-
-                self.display.image(self.image)
-                self.display.display()
-
-                time.sleep(self.stats_interval)
-                for i in range(int(self.stats_interval / 0.1)):
-                    if GPIO.event_detected(CENTER_CHANNEL):
-                        while GPIO.event_detected(CENTER_CHANNEL):
-                            pass
-                        while GPIO.event_detected(UP_CHANNEL):
-                            pass
-                        while GPIO.event_detected(RIGHT_CHANNEL):
-                            pass
-                        while GPIO.event_detected(LEFT_CHANNEL):
-                            pass
-                        while GPIO.event_detected(DOWN_CHANNEL):
-                            pass
-                        self.menu_on = True
-                    time.sleep(0.1)
+    def push_frame(self) -> int:
+        with timings.measure('display.convert'):
+            pages = image_to_pages(self.image)
+        with timings.measure('display.push'):
+            return self.frame_pusher.push(pages)
 
     def enable_stats(self):
-        # start stats display thread
+        self.post(self._enable_stats)
+
+    def disable_stats(self):
+        self.post(self._disable_stats)
+
+    def set_text(self, text):
+        self.post(self._set_text, text)
+
+    def _enable_stats(self):
         if not self.stats_enabled:
+            # the screen was cleared or used by set_text, draw everything again
+            self.stats_generation = -1
+            self.mark_dirty()
+            self.scheduler.trigger('sampling')
             self.stats_enabled = True
-            self.stats_thread = threading.Thread(target=self._run_display_stats)
-            self.stats_thread.start()
-        
-    def disable_stats(self):
+
+    def _disable_stats(self):
         self.stats_enabled = False
-        if self.stats_thread is not None:
-            self.stats_thread.join()
         self.draw.rectangle((0, 0, self.image.width, self.image.height), outline=0, fill=0)
-        self.display.image(self.image)
-        self.display.display()
+        self.push_frame()
 
-    def set_text(self, text):
-        self.disable_stats()
+    def _set_text(self, text):
+        self._disable_stats()
         self.draw.rectangle((0, 0, self.image.width, self.image.height), outline=0, fill=0)
         
         lines = text.split('\n')
         top = 2
         for line in lines:
-            self.draw.text((4, top), line, font=self.font, fill=255)
+            self.text_cache.draw_text(self.draw, (4, top), line, self.font)
             top += 10
         
-        self.display.image(self.image)
-        self.display.display()
+        self.push_frame()
         
 
-app = Flask(__name__)
+def create_app() -> Any:
+    '''
+    return the Flask app of the HTTP API, Flask is imported here as it is the slowest part of the startup
+    '''
+    from flask import Flask, Response, jsonify, request
+    app = Flask(__name__)
 
+    @app.route('/stats/on')
+    def enable_stats():
+        global server
+        server.enable_stats()
+        return "stats enabled"
 
-@app.route('/stats/on')
-def enable_stats():
-    global server
-    server.enable_stats()
-    return "stats enabled"
+    @app.route('/stats/off')
+    def disable_stats():
+        global server
+        server.disable_stats()
+        return "stats disabled"
 
-    
-@app.route('/stats/off')
-def disable_stats():
-    global server
-    server.disable_stats()
-    return "stats disabled"
+    @app.route('/stats/stream')
+    def stats_stream():
+        global server
+        events = server.broadcast.stream()
+        if events is None:
+            return "too many stats streams open, at most %d" % server.broadcast.max_subscribers, 503, {'Retry-After': '15'}
+        return Response(events, mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    @app.route('/metrics')
+    def metrics():
+        global server
+        return Response(server.exporter.exposition(), content_type=CONTENT_TYPE)
+
+    @app.route('/stats/history')
+    def stats_history():
+        global server
+        metric = request.args.get('metric', 'cpu')
+        if metric not in METRICS:
+            return "unknown metric %s, expected one of %s" % (metric, ', '.join(METRICS)), 400
+        try:
+            since = float(request.args.get('since', -600))
+        except ValueError:
+            return "since must be a unix timestamp, or negative seconds before now", 400
+        if since < 0:
+            since += time.time()
+        resolution, timestamps, values = server.history.query(metric, since)
+        return jsonify(metric=metric, resolution=resolution, timestamps=timestamps.tolist(), values=values.tolist())
+
+    @app.route('/stats/page/<name>')
+    def stats_page(name):
+        global server
+        if name not in server.stats_pages:
+            return "unknown page %s, expected one of %s" % (name, ', '.join(server.stats_pages)), 404
+        server.post(server.show_stats_page, server.stats_pages.index(name))
+        return "stats page %s" % name
+
+    @app.route('/display/rate')
+    def display_rate():
+        global server
+        pusher = server.frame_pusher
+        cache = server.text_cache
+        return "%.1f fps, %d frames rendered, %d renders skipped, %.1f bytes/s, %d bytes sent, %d frames pushed, %d frames skipped, " \
+            "text cache %d/%d entries, %d hits, %d misses" % (
+            server.effective_fps(), server.frames_rendered, server.renders_skipped,
+            pusher.bytes_per_second, pusher.bytes_sent, pusher.frames_pushed, pusher.frames_skipped,
+            len(cache.entries), cache.max_entries, cache.hits, cache.misses)
+
+    @app.route('/display/schedule')
+    def display_schedule():
+        global server
+        return "\n".join("%s: every %.3f s, %d runs, %d missed, %.1f ms max late, %.1f ms last, %.1f ms max" % (
+            task.name, task.interval, task.runs, task.missed, task.max_lateness * 1e3, task.last_duration * 1e3, task.max_duration * 1e3)
+            for task in server.scheduler.tasks)
+
+    @app.route('/debug/timings')
+    def debug_timings():
+        # ?enable=1 / ?enable=0 switches profiling at runtime, ?reset=1 clears the histograms
+        if 'enable' in request.args:
+            timings.enabled = request.args['enable'] not in ('', '0')
+        if request.args.get('reset') not in (None, '', '0'):
+            timings.reset()
+        return Response(timings.report() + '\n', content_type='text/plain')
+
+    @app.route('/text/<text>')
+    def set_text(text):
+        global server
+        server.set_text(text)
+        return 'set text: \n\n%s' % text
+
+    return app
 
 
-@app.route('/text/<text>')
-def set_text(text):
-    global server
-    server.set_text(text)
-    return 'set text: \n\n%s' % text
+def serve(host: str = '0.0.0.0', port: int = 8000, threads: int = STREAM_SUBSCRIBERS + 8) -> None:
+    '''
+    Serve the HTTP API with waitress when it is installed (pip3 install waitress), else with
+    the werkzeug development server
+    '''
+    app = create_app()
+    try:
+        import waitress
+    except ImportError:
+        waitress = None
+    if waitress is not None:
+        # every open /stats/stream holds one of the worker threads, the streams are capped
+        # at STREAM_SUBSCRIBERS so the other requests always find a free one
+        waitress.serve(app, host=host, port=port, threads=threads)
+        return
+    # NOTE: this is the werkzeug DEVELOPMENT server, not meant for production use. Thread per
+    # connection, an open /stats/stream never holds up the other requests
+    print('waitress is not installed, serving the HTTP API with the werkzeug development server', file=sys.stderr)
+    from werkzeug.serving import make_server
+    http_server = make_server(host, port, app, threaded=True)
+    http_server.daemon_threads = True
+    http_server.serve_forever()
 
 
 if __name__ == '__main__':
-    server = DisplayServer()
-    app.run(host='0.0.0.0', port='8000', debug=False)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profile', action='store_true', help='collect per stage timings, same as %s=1' % PROFILE_ENV)
+    parser.add_argument('--simulate', action='store_true', help='run on in-memory display, buttons and jtop fakes')
+    args = parser.parse_args()
+    if args.profile:
+        timings.enabled = True
+    # installed even when profiling is off, it may be switched on later through /debug/timings
+    signal.signal(signal.SIGUSR1, lambda signum, frame: print(timings.report(), file=sys.stderr, flush=True))
+    if args.simulate:
+        server = DisplayServer(display=FramebufferDisplay(), gpio=ScriptedGPIO(), jtop_factory=SyntheticJtop)
+    else:
+        server = DisplayServer()
+    serve()
 
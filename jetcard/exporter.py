@@ -0,0 +1,73 @@
+import threading
+from typing import Callable, List, Tuple
+from .sampler import JtopSampler
+
+CONTENT_TYPE = 'application/openmetrics-text; version=1.0.0; charset=utf-8'
+
+# gauge name, StatsSnapshot field, help
+SNAPSHOT_GAUGES = [('jetcard_power_watts', 'power_watts', 'Total board power draw.'),
+                   ('jetcard_cpu_utilization_percent', 'cpu_percent', 'CPU utilization over all cores.'),
+                   ('jetcard_gpu_utilization_percent', 'gpu_percent', 'GPU load.'),
+                   ('jetcard_ram_used_percent', 'ram_percent', 'Used share of the RAM.'),
+                   ('jetcard_disk_used_percent', 'disk_percent', 'Used share of the root filesystem.')]
+
+# (name, 'counter' or 'gauge', help, value), counter names without the _total suffix
+Counter = Tuple[str, str, str, float]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value: float) -> str:
+    return '%d' % value if isinstance(value, int) else repr(float(value))
+
+
+def _family(lines: List[str], name: str, metric_type: str, help_text: str) -> None:
+    lines.append('# TYPE %s %s' % (name, metric_type))
+    lines.append('# HELP %s %s' % (name, help_text))
+
+
+class MetricsExporter:
+    '''
+    OpenMetrics text exposition of the latest sampler snapshot and the daemon health counters.
+
+    The text is rendered once per sampler generation, scrapes in between return the
+    cached bytes. Health counters are therefore as fresh as the last sample.
+    '''
+    def __init__(self, sampler: JtopSampler, counters: Callable[[], List[Counter]]) -> None:
+        self.sampler = sampler
+        self.counters = counters
+        self.lock = threading.Lock()
+        self.generation = -1
+        self.text = b''
+        self.renders = 0
+
+    def exposition(self) -> bytes:
+        generation = self.sampler.generation
+        if generation != self.generation:
+            with self.lock:
+                if generation != self.generation:
+                    self.text = self.render()
+                    self.generation = generation
+                    self.renders += 1
+        return self.text
+
+    def render(self) -> bytes:
+        snapshot = self.sampler.snapshot
+        lines: List[str] = []
+        _family(lines, 'jetcard_stats_available', 'gauge', 'Whether the last jtop sample succeeded.')
+        lines.append('jetcard_stats_available %d' % snapshot.available)
+        _family(lines, 'jetcard_sample_timestamp_seconds', 'gauge', 'Unix time of the last sample.')
+        lines.append('jetcard_sample_timestamp_seconds %.3f' % snapshot.timestamp)
+        if snapshot.available:
+            for name, field, help_text in SNAPSHOT_GAUGES:
+                _family(lines, name, 'gauge', help_text)
+                lines.append('%s %s' % (name, _number(float(getattr(snapshot, field)))))
+            _family(lines, 'jetcard_power_mode', 'info', 'nvpmodel power mode.')
+            lines.append('jetcard_power_mode_info{mode="%s"} 1' % _escape(snapshot.power_mode))
+        for name, metric_type, help_text, value in self.counters():
+            _family(lines, name, metric_type, help_text)
+            lines.append('%s%s %s' % (name, '_total' if metric_type == 'counter' else '', _number(value)))
+        lines.append('# EOF\n')
+        return '\n'.join(lines).encode()
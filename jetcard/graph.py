@@ -0,0 +1,48 @@
+import numpy as np
+import PIL.Image
+import PIL.ImageDraw
+from typing import Any
+from .oled import TextCache
+
+# graph page metric -> (label, unit, full scale, None to scale to the largest value shown)
+GRAPH_METRICS = {'cpu': ('CPU', '%', 100.0),
+                 'gpu': ('GPU', '%', 100.0),
+                 'power': ('PWR', 'W', None),
+                 'ram': ('RAM', '%', 100.0)}
+LABEL_WIDTH = 30    # pixels left of the plot used by the label and the current value
+
+
+def sparkline(values: np.ndarray, width: int, height: int, full_scale: float) -> np.ndarray:
+    '''
+    Plot the last width values as a connected line, the newest value in the rightmost column.
+    return bool array of shape (height, width), True for lit pixels
+    '''
+    pixels = np.zeros((height, width), dtype=np.bool_)
+    values = np.asarray(values, dtype=np.float32)[-width:]
+    count = len(values)
+    if count == 0 or full_scale <= 0:
+        return pixels
+    y = np.rint((height - 1) * (1.0 - np.clip(values / full_scale, 0.0, 1.0))).astype(np.int32)
+    # every column spans from the previous point to its own point, so steep changes stay connected
+    previous = np.concatenate((y[:1], y[:-1]))
+    low = np.minimum(y, previous)
+    high = np.maximum(y, previous)
+    rows = np.arange(height, dtype=np.int32)[:, None]
+    pixels[:, width - count:] = (rows >= low) & (rows <= high)
+    return pixels
+
+
+def draw_graph(draw: PIL.ImageDraw.ImageDraw, text_cache: TextCache, font: Any, metric: str, values: np.ndarray,
+               width: int, height: int) -> None:
+    '''
+    Draw the graph page of metric: label and latest value on the left, sparkline on the right
+    '''
+    label, unit, full_scale = GRAPH_METRICS[metric]
+    if full_scale is None:
+        full_scale = float(values.max()) * 1.25 if len(values) and values.max() > 0 else 1.0
+    text_cache.draw_text(draw, (0, -2), label, font)
+    text_cache.draw_text(draw, (0, 6), ("%3d" % values[-1] if len(values) else ' --') + unit, font)
+    if unit != '%':
+        text_cache.draw_text(draw, (0, 22), "%.0f%s" % (full_scale, unit), font)
+    plot = sparkline(values, width - LABEL_WIDTH, height, full_scale)
+    draw.bitmap((LABEL_WIDTH, 0), PIL.Image.fromarray(plot), fill=255)
@@ -0,0 +1,188 @@
+'''
+Hardware layer of the display daemon and in-memory stand-ins for running it off-device.
+
+    server = DisplayServer(display=FramebufferDisplay(), gpio=ScriptedGPIO(), jtop_factory=SyntheticJtop)
+'''
+import collections
+import math
+import threading
+import time
+import numpy as np
+from typing import Any, List, Tuple
+from .buttons import SimulatedGPIO
+from .oled import SSD1306_COLUMNADDR, SSD1306_PAGEADDR
+
+
+def default_display() -> Any:
+    import Adafruit_SSD1306
+    return Adafruit_SSD1306.SSD1306_128_32(rst=None, i2c_bus=7, gpio=1)
+
+
+class RecordingI2C:
+    '''
+    I2C side of an SSD1306 kept in memory: commands set the column/page window and data
+    bytes are written to the display RAM in horizontal addressing order, like the controller.
+    '''
+    def __init__(self, width: int, pages: int) -> None:
+        self.width = width
+        self.pages = pages
+        self.ram = np.zeros((pages, width), dtype=np.uint8)
+        self.window = (0, width - 1, 0, pages - 1)
+        self.column = 0
+        self.page = 0
+        self.pending: List[int] = []    # command followed by its arguments
+        self.transfers = 0              # I2C write transactions
+        self.bytes_sent = 0             # including the control byte of every transaction
+        self.data_bytes = 0
+        self.last_write = 0.0           # time.monotonic() of the last data transfer
+        self.log: collections.deque = collections.deque(maxlen=4096)   # (time.monotonic(), bytes) of data transfers
+        self.written = threading.Event()
+
+    def write8(self, register: int, value: int) -> None:
+        self.transfers += 1
+        self.bytes_sent += 2
+        self.pending.append(value)
+        command = self.pending[0]
+        if command in (SSD1306_COLUMNADDR, SSD1306_PAGEADDR):
+            if len(self.pending) < 3:
+                return
+            start, end = self.pending[1:]
+            if command == SSD1306_COLUMNADDR:
+                self.window = (start, end) + self.window[2:]
+                self.column = start
+            else:
+                self.window = self.window[:2] + (start, end)
+                self.page = start
+        self.pending = []
+
+    def writeList(self, register: int, data: List[int]) -> None:
+        self.transfers += 1
+        self.bytes_sent += len(data) + 1
+        self.data_bytes += len(data)
+        col_start, col_end, page_start, page_end = self.window
+        for value in data:
+            self.ram[self.page, self.column] = value
+            self.column += 1
+            if self.column > col_end:
+                self.column = col_start
+                self.page = self.page + 1 if self.page < page_end else page_start
+        self.last_write = time.monotonic()
+        self.log.append((self.last_write, len(data)))
+        self.written.set()
+
+
+class FramebufferDisplay:
+    '''
+    Stand-in for Adafruit_SSD1306.SSD1306_128_32 recording every transfer in a RecordingI2C
+    '''
+    def __init__(self, width: int = 128, height: int = 32) -> None:
+        self.width = width
+        self.height = height
+        self._pages = height // 8
+        self._buffer = [0] * (width * self._pages)
+        self._spi = None
+        self._i2c = RecordingI2C(width, self._pages)
+
+    def begin(self, vccstate: Any = None) -> None:
+        pass
+
+    def command(self, c: int) -> None:
+        self._i2c.write8(0x00, c)
+
+    def clear(self) -> None:
+        self._buffer = [0] * (self.width * self._pages)
+
+    def display(self) -> None:
+        self.command(SSD1306_COLUMNADDR)
+        self.command(0)
+        self.command(self.width - 1)
+        self.command(SSD1306_PAGEADDR)
+        self.command(0)
+        self.command(self._pages - 1)
+        for i in range(0, len(self._buffer), 16):
+            self._i2c.writeList(0x40, self._buffer[i:i+16])
+
+    def pixels(self) -> np.ndarray:
+        '''
+        return the panel content as a (height, width) bool array
+        '''
+        bits = np.unpackbits(self._i2c.ram[:, np.newaxis, :], axis=1, bitorder='little')
+        return bits.reshape(self.height, self.width).astype(np.bool_)
+
+
+class ScriptedGPIO(SimulatedGPIO):
+    '''
+    SimulatedGPIO replaying a button script from a background thread.
+
+    script: (delay, channel, hold) tuples, press channel delay seconds after the previous
+    step and release it hold seconds later.
+    '''
+    def __init__(self) -> None:
+        super().__init__()
+        self.played: List[Tuple[int, float]] = []   # (channel, time.monotonic()) of every scripted press
+
+    def play(self, script: List[Tuple[float, int, float]]) -> threading.Thread:
+        thread = threading.Thread(target=self._play, args=(list(script),), name='scripted-gpio', daemon=True)
+        thread.start()
+        return thread
+
+    def _play(self, script: List[Tuple[float, int, float]]) -> None:
+        for delay, channel, hold in script:
+            time.sleep(delay)
+            self.played.append((channel, time.monotonic()))
+            self.press(channel)
+            time.sleep(hold)
+            self.release(channel)
+
+
+class SyntheticJtop:
+    '''
+    jtop replacement producing slowly varying, deterministic readings every interval seconds
+    '''
+    def __init__(self, interval: float = 1.0) -> None:
+        self.interval = interval
+        self.samples = 0
+        self.closed = threading.Event()
+
+    def __enter__(self) -> 'SyntheticJtop':
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.closed.set()
+
+    def ok(self) -> bool:
+        if self.samples:
+            self.closed.wait(self.interval)
+        self.samples += 1
+        return not self.closed.is_set()
+
+    def _wave(self, period: float, low: float, high: float) -> float:
+        return low + (high - low) * (0.5 + 0.5 * math.sin(2 * math.pi * self.samples / period))
+
+    @property
+    def local_interfaces(self) -> dict:
+        return {'interfaces': {'eth0': '192.168.55.1'}}
+
+    @property
+    def gpu(self) -> dict:
+        return {'gpu': {'status': {'load': self._wave(60, 0, 100)}}}
+
+    @property
+    def nvpmodel(self) -> str:
+        return 'MAXN'
+
+    @property
+    def power(self) -> dict:
+        return {'tot': {'power': self._wave(45, 2000, 10000)}}
+
+    @property
+    def cpu(self) -> dict:
+        return {'total': {'idle': self._wave(30, 10, 95)}}
+
+    @property
+    def memory(self) -> dict:
+        return {'RAM': {'used': self._wave(120, 1.0e6, 3.5e6), 'tot': 4.0e6}}
+
+    @property
+    def disk(self) -> dict:
+        return {'used': 21.0, 'total': 58.0}
@@ -0,0 +1,114 @@
+import threading
+import numpy as np
+from typing import List, Tuple, Union
+from .sampler import StatsSnapshot
+
+# history metric name -> StatsSnapshot field
+METRICS = {'power': 'power_watts',
+           'cpu': 'cpu_percent',
+           'gpu': 'gpu_percent',
+           'ram': 'ram_percent',
+           'disk': 'disk_percent'}
+
+
+class RingSeries:
+    '''
+    Fixed capacity ring of (timestamp, values) rows, the oldest row is overwritten once full
+    '''
+    def __init__(self, capacity: int, columns: int) -> None:
+        self.capacity = capacity
+        self.timestamps = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros((capacity, columns), dtype=np.float32)
+        self.head = 0       # next row written
+        self.count = 0
+
+    def append(self, timestamp: float, values: np.ndarray) -> None:
+        self.timestamps[self.head] = timestamp
+        self.values[self.head] = values
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def oldest(self) -> Union[float, None]:
+        return self.timestamps[(self.head - self.count) % self.capacity] if self.count else None
+
+    def since(self, since: float, column: int) -> Tuple[np.ndarray, np.ndarray]:
+        '''
+        return copies of the timestamps and the values of one column newer or equal to since, oldest first
+        '''
+        start = (self.head - self.count) % self.capacity
+        if start + self.count <= self.capacity:
+            timestamps = self.timestamps[start:start + self.count]
+            values = self.values[start:start + self.count, column]
+        else:
+            timestamps = np.concatenate((self.timestamps[start:], self.timestamps[:self.head]))
+            values = np.concatenate((self.values[start:, column], self.values[:self.head, column]))
+        first = np.searchsorted(timestamps, since, side='left')
+        return timestamps[first:].copy(), values[first:].copy()
+
+
+class MetricsHistory:
+    '''
+    Constant memory history of the sampled metrics.
+
+    Every sample is kept in the fine ring (fine_capacity samples, 10 minutes at the
+    1 s sampling interval). Samples are also averaged per `coarse_resolution`
+    seconds into the coarse ring (24 hours of 1 minute means by default). Queries
+    are answered from the finest ring still covering the requested time.
+    '''
+    def __init__(self, fine_capacity: int = 600, coarse_resolution: float = 60.0, coarse_capacity: int = 1440) -> None:
+        self.metrics: List[str] = list(METRICS)
+        self.fields: List[str] = [METRICS[metric] for metric in self.metrics]
+        self.fine = RingSeries(fine_capacity, len(self.metrics))
+        self.coarse = RingSeries(coarse_capacity, len(self.metrics))
+        self.coarse_resolution = coarse_resolution
+        self.bucket: Union[int, None] = None
+        self.bucket_sum = np.zeros(len(self.metrics), dtype=np.float64)
+        self.bucket_count = 0
+        self.lock = threading.Lock()
+
+    def record(self, snapshot: StatsSnapshot) -> None:
+        if not snapshot.available:
+            return
+        values = np.array([getattr(snapshot, field) for field in self.fields], dtype=np.float64)
+        bucket = int(snapshot.timestamp // self.coarse_resolution)
+        with self.lock:
+            self.fine.append(snapshot.timestamp, values)
+            if bucket != self.bucket:
+                self._close_bucket()
+                self.bucket = bucket
+            self.bucket_sum += values
+            self.bucket_count += 1
+
+    def _close_bucket(self) -> None:
+        # called with the lock held, the mean is stamped with the start of its bucket
+        if self.bucket_count:
+            self.coarse.append(self.bucket * self.coarse_resolution, self.bucket_sum / self.bucket_count)
+        self.bucket_sum[:] = 0
+        self.bucket_count = 0
+
+    def query(self, metric: str, since: float) -> Tuple[float, np.ndarray, np.ndarray]:
+        '''
+        return (resolution, timestamps, values) of metric since the given time, resolution 0 for raw samples
+        '''
+        column = self.metrics.index(metric)
+        with self.lock:
+            oldest = self.fine.oldest()
+            if oldest is not None and (since >= oldest or self.coarse.count == 0):
+                timestamps, values = self.fine.since(since, column)
+                return 0.0, timestamps, values
+            timestamps, values = self.coarse.since(since, column)
+            if self.bucket_count and self.bucket * self.coarse_resolution >= since:
+                # include the minute still being averaged
+                timestamps = np.append(timestamps, self.bucket * self.coarse_resolution)
+                values = np.append(values, np.float32(self.bucket_sum[column] / self.bucket_count))
+            return self.coarse_resolution, timestamps, values
+
+    def latest(self, metric: str, count: int) -> np.ndarray:
+        '''
+        return the last count raw samples of metric, oldest first
+        '''
+        column = self.metrics.index(metric)
+        with self.lock:
+            count = min(count, self.fine.count)
+            rows = (self.fine.head - count + np.arange(count)) % self.fine.capacity
+            return self.fine.values[rows, column]
@@ -1,70 +1,529 @@
+import atexit
 import socket
 import threading
 import uuid
 import time
 import json
-from jetcard.display_server import IPCConnection, IPCPacket
-from typing import Union, Any
+import heapq
+import weakref
+import collections
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from jetcard.display_server import CONSOLE_CAPACITY, IPCConnection, IPCPacket
+from jetcard.protocol import PROTOCOL_BINARY, PROTOCOL_VERSION, item_kwargs
+from typing import Callable, Dict, List, Union, Any
+
+MENU_ADDRESS = '/tmp/menu_socket'
+# packets rebuilding the menu tree, not queued while disconnected since connect() replays the whole tree
+TREE_ACTIONS = ('reset_menu', 'create_item', 'create_tree')
 
 class IPCClient(IPCConnection):
-    def __init__(self, address: str) -> None:
+    def __init__(self, address: str, chunk_size: int = 65536) -> None:
         self.address: str = address
         conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        conn.connect(address)
-        super().__init__(connection=conn, blocking=True)
+        try:
+            conn.connect(address)
+        except OSError:
+            conn.close()
+            raise
+        super().__init__(connection=conn, blocking=True, chunk_size=chunk_size)
+        self.hello()
+
+class CallbackRun:
+    def __init__(self, func: 'Function') -> None:
+        self.func = func
+        self.cancelled = False  # timed out or replaced, the result is ignored
+        self.done = False
+        self.started: Union[float, None] = None
+
+class CallbackExecutor:
+    '''
+    Run Function callbacks on a shared, bounded worker pool, away from the ipc_recv thread.
+
+    Calls of one Function never run concurrently, what happens to a call arriving while
+    the previous one runs is chosen by Function.policy:
+        'queue': run it after the current one (bounded by max_queue)
+        'drop': ignore it
+        'replace': cancel the current one and the queued ones, run the new call right away
+    A call running longer than Function.timeout is cancelled, marked on the OLED and
+    reported as completed so the menu can be left. Python threads cannot be killed,
+    callbacks can poll Function.cancelled() to stop early.
+    '''
+    def __init__(self, max_workers: int = 4, max_queue: int = 32) -> None:
+        self.pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='oled-callback')
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.lock = threading.Lock()
+        self.current = threading.local()    # run executed by the calling worker thread
+        self.queued = 0
+        self.running = 0
+        self.completed = 0
+        self.dropped = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.last_duration = 0.0
+        self.max_duration = 0.0
+        self.total_duration = 0.0
+        self.deadlines: list = []           # heap of (deadline, sequence, run)
+        self.deadline_seq = 0
+        self.watchdog_cond = threading.Condition(self.lock)
+        self.watchdog_thread: Union[threading.Thread, None] = None
+
+    def status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {'workers': self.max_workers,
+                    'running': self.running,
+                    'queued': self.queued,
+                    'completed': self.completed,
+                    'dropped': self.dropped,
+                    'timeouts': self.timeouts,
+                    'errors': self.errors,
+                    'last_duration': self.last_duration,
+                    'max_duration': self.max_duration,
+                    'mean_duration': self.total_duration / self.completed if self.completed else 0.0}
+
+    def current_run(self) -> Union[CallbackRun, None]:
+        return getattr(self.current, 'run', None)
+
+    def submit(self, func: 'Function') -> None:
+        run = CallbackRun(func)
+        with self.lock:
+            active = func._active_run
+            if active is not None:
+                if func.policy == 'drop':
+                    self.dropped += 1
+                    return
+                if func.policy == 'replace':
+                    active.cancelled = True
+                    self.queued -= len(func._pending_runs)
+                    self.dropped += len(func._pending_runs)
+                    func._pending_runs.clear()
+                    active = None
+                elif self.queued >= self.max_queue:
+                    self.dropped += 1
+                    return
+                else:
+                    func._pending_runs.append(run)
+                    self.queued += 1
+                    return
+            self._start(run)
+
+    def _start(self, run: CallbackRun) -> None:
+        # called with the lock held
+        run.func._active_run = run
+        self.queued += 1
+        self.pool.submit(self._run, run)
+
+    def _run(self, run: CallbackRun) -> None:
+        func = run.func
+        with self.lock:
+            self.queued -= 1
+            self.running += 1
+            run.started = time.monotonic()
+            if func.timeout is not None:
+                self._watch(run, run.started + func.timeout)
+        self.current.run = run
+        ret = False
+        try:
+            ret = True if func.callback == None else func.callback(func)
+        except Exception as e:
+            with self.lock:
+                self.errors += 1
+            func.callback_print('error:', e)
+        finally:
+            self.current.run = None
+        duration = time.monotonic() - run.started
+        with self.lock:
+            run.done = True
+            self.running -= 1
+            self.completed += 1
+            self.last_duration = duration
+            self.max_duration = max(self.max_duration, duration)
+            self.total_duration += duration
+            cancelled = run.cancelled
+            self._finish(run)
+        if not cancelled:
+            func.complete(ret == True)
+
+    def _finish(self, run: CallbackRun) -> None:
+        # called with the lock held, hand the function slot to its next queued call
+        func = run.func
+        if func._active_run is run:
+            func._active_run = None
+            if func._pending_runs:
+                self.queued -= 1
+                self._start(func._pending_runs.popleft())
+
+    def _watch(self, run: CallbackRun, deadline: float) -> None:
+        # called with the lock held
+        self.deadline_seq += 1
+        heapq.heappush(self.deadlines, (deadline, self.deadline_seq, run))
+        if self.watchdog_thread is None:
+            self.watchdog_thread = threading.Thread(target=self._watchdog, name='oled-callback-watchdog', daemon=True)
+            self.watchdog_thread.start()
+        self.watchdog_cond.notify()
+
+    def _watchdog(self) -> None:
+        while True:
+            with self.lock:
+                while not self.deadlines or self.deadlines[0][0] > time.monotonic():
+                    self.watchdog_cond.wait(self.deadlines[0][0] - time.monotonic() if self.deadlines else None)
+                deadline, _, run = heapq.heappop(self.deadlines)
+                if run.done or run.cancelled:
+                    continue
+                run.cancelled = True
+                self.timeouts += 1
+                self._finish(run)
+            run.func.callback_print('timeout after {t:g}s'.format(t=run.func.timeout))
+            run.func.complete(False)
+
+class ConsoleWriter:
+    '''
+    Coalesce printed lines into append_lines packets, sent at most every `interval` seconds.
+
+    Only the newest `capacity` pending lines of a console are kept, the server ring
+    would drop the older ones anyway. `capacity` is the default for consoles that
+    do not pass their own.
+    '''
+    def __init__(self, send: Callable[[List[IPCPacket]], None], interval: float = 0.05, capacity: int = CONSOLE_CAPACITY) -> None:
+        self.send = send
+        self.interval = interval
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()     # keeps the lines ahead of packets sent after flush()
+        self.cond = threading.Condition(self.lock)
+        self.pending: Dict[str, collections.deque] = {}
+        self.deadline: Union[float, None] = None
+        self.thread: Union[threading.Thread, None] = None
+        self.lines_written = 0
+        self.lines_dropped = 0
+        self.packets_sent = 0
+
+    def write(self, uuid: str, line: str, capacity: Union[int, None] = None) -> None:
+        with self.lock:
+            lines = self.pending.get(uuid)
+            if lines is None:
+                lines = self.pending[uuid] = collections.deque(maxlen=capacity or self.capacity)
+            elif len(lines) == lines.maxlen:
+                self.lines_dropped += 1
+            lines.append(line)
+            self.lines_written += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._flusher, name='oled-console', daemon=True)
+                self.thread.start()
+            if self.deadline is None:
+                self.deadline = time.monotonic() + self.interval
+                self.cond.notify()
+
+    def discard(self, uuid: Union[str, None] = None) -> None:
+        with self.lock:
+            if uuid is None:
+                self.pending.clear()
+            else:
+                self.pending.pop(uuid, None)
+
+    def flush(self, uuid: Union[str, None] = None) -> None:
+        '''
+        Send the pending lines now, of one console or of all of them
+        '''
+        with self.flush_lock:
+            with self.lock:
+                if uuid is None:
+                    pending, self.pending = self.pending, {}
+                    self.deadline = None
+                else:
+                    lines = self.pending.pop(uuid, None)
+                    pending = {uuid: lines} if lines else {}
+            if pending:
+                self.send([IPCPacket(action='append_lines', kwargs={'uuid': uuid, 'lines': list(lines)})
+                           for uuid, lines in pending.items()])
+                self.packets_sent += len(pending)
+
+    def _flusher(self) -> None:
+        while True:
+            with self.lock:
+                while self.deadline is None or self.deadline > time.monotonic():
+                    self.cond.wait(self.deadline - time.monotonic() if self.deadline is not None else None)
+            self.flush()
 
 class OLEDMenu:
-    def __init__(self) -> None:
-        self.obj_list: list[Item] = []
+    def __init__(self, weak: bool = False, address: str = MENU_ADDRESS, max_pending: int = 256,
+                 min_backoff: float = 0.1, max_backoff: float = 5.0) -> None:
+        '''
+        weak: hold the registered items by weak reference, items dropped by the user stop receiving updates
+        address: display server socket, connected on the first packet sent and reconnected whenever it closes
+        max_pending: packets queued while disconnected, the oldest ones are dropped beyond that
+        min_backoff, max_backoff: seconds between reconnection attempts, doubled after every failure
+        '''
+        # uuid keyed registry of the created items, and uuid of the children created under each root
+        self.registry: Dict[str, Item] = weakref.WeakValueDictionary() if weak else {}
+        self.children: Dict[str, List[str]] = {}
+        self.registry_lock = threading.Lock()
+        self.batch_state = threading.local()    # items collected by batch(), per thread
+        self.unsent: set = set()                # uuid of registered items waiting in a batch, not replayed
+        self.executor = CallbackExecutor()
+        self.console_writer = ConsoleWriter(self.send_packets)
         self.actions = {'update_value': self.update_value}
-        menu_address = '/tmp/menu_socket'
-        self.ipc = IPCClient(menu_address)
-        self.ipc_recv_thread = threading.Thread(target=self.ipc_recv)
-        self.ipc_recv_thread.start()
-        
+        self.address = address
+        self.ipc: Union[IPCClient, None] = None
+        self.version: int = PROTOCOL_VERSION    # of the current or last connection, assumed until the first one
+        self.conn_lock = threading.RLock()      # connect, replay and send one at a time
+        self.outbox: collections.deque = collections.deque(maxlen=max_pending)
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.stopping = threading.Event()
+        self.ipc_recv_thread: Union[threading.Thread, None] = None
+        self.connects = 0
+        self.packets_dropped = 0
+
+    def start(self) -> None:
+        with self.conn_lock:
+            if self.ipc_recv_thread is not None:
+                return
+            self.connect()
+            self.ipc_recv_thread = threading.Thread(target=self.ipc_recv, name='oled-menu-recv', daemon=True)
+            self.ipc_recv_thread.start()
+            atexit.register(self.close)
+
+    def connect(self) -> bool:
+        '''
+        Connect to the display server, replay the menu tree and send the queued packets.
+        return True when connected
+        '''
+        with self.conn_lock:
+            if self.ipc is not None:
+                return True
+            if self.stopping.is_set():
+                return False
+            try:
+                ipc = IPCClient(self.address)
+            except OSError:
+                return False
+            self.version = ipc.version
+            queued = list(self.outbox)
+            if self.version < PROTOCOL_BINARY:
+                # console lines printed before the server was known, it has no console to append them to
+                queued = [packet for packet in queued if packet.action != 'append_lines']
+            if not ipc.send(self.replay_packets() + queued):
+                ipc.connection.close()
+                return False
+            self.outbox.clear()
+            self.ipc = ipc
+            self.connects += 1
+            return True
+
+    def disconnect(self, ipc: IPCClient) -> None:
+        # wakes the receive thread blocked on the socket up, it closes the socket and reconnects
+        with self.conn_lock:
+            if self.ipc is ipc:
+                self.ipc = None
+        try:
+            ipc.connection.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+    def close(self, timeout: float = 1.0) -> None:
+        '''
+        Send the pending console lines, then close the connection and stop reconnecting
+        '''
+        self.console_writer.flush()
+        self.stopping.set()
+        ipc = self.ipc
+        if ipc is not None:
+            self.disconnect(ipc)
+        thread = self.ipc_recv_thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+    def connection_status(self) -> Dict[str, Any]:
+        return {'connected': self.ipc is not None,
+                'connects': self.connects,
+                'queued': len(self.outbox),
+                'dropped': self.packets_dropped}
+
     def reset(self) -> None:
+        self.console_writer.discard()
         self.send(IPCPacket(action='reset_menu'))
+        with self.registry_lock:
+            self.registry.clear()
+            self.children.clear()
+
+    def registry_size(self) -> int:
+        return len(self.registry)
+
+    def callback_status(self) -> Dict[str, Any]:
+        return self.executor.status()
+
+    def register(self, obj: 'Item') -> None:
+        root = obj.root.uuid if obj.root else 'base'
+        with self.registry_lock:
+            self.registry[obj.uuid] = obj
+            self.children.setdefault(root, []).append(obj.uuid)
+
+    def drop_children(self, uuid: str) -> None:
+        '''
+        Forget the whole subtree below uuid, the item itself stays registered
+        '''
+        with self.registry_lock:
+            pending = self.children.pop(uuid, [])
+            while pending:
+                child = pending.pop()
+                self.registry.pop(child, None)
+                pending += self.children.pop(child, [])
 
     def update_value(self, *args, uuid: Union[str, None] = None, value: Any = True, **kwargs) -> None:
-        for item in self.obj_list:
-            if item.uuid == uuid:
-                item.update(value)
-                break
+        item = self.registry.get(uuid)
+        if item is not None:
+            item.update(value)
 
     def ipc_recv(self) -> None:
-        while True:
-            packets = self.ipc.recv()
+        backoff = self.min_backoff
+        while not self.stopping.is_set():
+            ipc = self.ipc
+            if ipc is None:
+                if self.connect():
+                    backoff = self.min_backoff
+                else:
+                    self.stopping.wait(backoff)
+                    backoff = min(2 * backoff, self.max_backoff)
+                continue
+            try:
+                packets = ipc.recv()
+            except OSError:
+                packets = []
+                ipc.closed = True
             for packet in packets:
                 self.actions[packet.action](self, *packet.args, **packet.kwargs)
-                    
+            if ipc.closed:
+                # the server went away, a restarted one starts with an empty menu
+                self.disconnect(ipc)
+                ipc.connection.close()
+
+    def replay_packets(self) -> List[IPCPacket]:
+        # every registered item, each root before its children
+        items = []
+        with self.registry_lock:
+            pending = list(reversed(self.children.get('base', [])))
+            while pending:
+                uuid = pending.pop()
+                obj = self.registry.get(uuid)
+                if obj is None or uuid in self.unsent:
+                    continue
+                items.append(item_kwargs(obj, self.version))
+                pending += reversed(self.children.get(uuid, []))
+        return self.tree_packets(items) if items else []
+
     def send(self, packet: IPCPacket) -> None:
-        self.ipc.send([packet])
-    
-    def add(self, obj: 'Item') -> None:
-        kwargs = {'root': obj.root.uuid if obj.root else 'base',
-                  'name': obj.get_description(),
-                  'uuid': obj.uuid}
-        action = "create_item"
-        if isinstance(obj, Function):
-            kwargs['create_type'] = 'func'
-        elif isinstance(obj, Menu):
-            kwargs['create_type'] = 'menu'
-        elif isinstance(obj, Variable):
-            kwargs['create_type'] = 'var'
-            kwargs['value'] = obj.get_value()
-            kwargs['step'] = obj.get_step()
+        # keep the packet order, items created earlier in a batch go out first
+        self.flush_batch()
+        self.send_packets([packet])
+
+    def send_packets(self, packets: List[IPCPacket]) -> None:
+        if self.ipc_recv_thread is None:
+            self.start()
+        with self.conn_lock:
+            ipc = self.ipc
+            if ipc is not None:
+                if ipc.send(packets):
+                    return
+                self.disconnect(ipc)
+            for packet in packets:
+                if packet.action in TREE_ACTIONS:
+                    continue
+                if len(self.outbox) == self.outbox.maxlen:
+                    self.packets_dropped += 1
+                self.outbox.append(packet)
+
+    def console_print(self, console: 'Menu', *args) -> None:
+        line = " ".join(str(arg) for arg in args)
+        if self.version >= PROTOCOL_BINARY:
+            self.console_writer.write(console.uuid, line, getattr(console, 'capacity', None))
         else:
-            kwargs['create_type'] = 'item'
-        self.send(IPCPacket(action=action, kwargs=kwargs))
-        self.obj_list.append(obj)
-        
+            # server without console support, one item per line
+            Item(root=console, description=line + " ")
+
+    @contextmanager
+    def batch(self):
+        '''
+        Collect every item created inside the block and send them in a single create_tree packet
+
+            with oled_menu.batch():
+                menu = Menu(description='tuning')
+                lr = FloatVariable(root=menu, description='lr', value=0.001, step=0.0001)
+        '''
+        state = self.batch_state
+        if getattr(state, 'depth', 0) == 0:
+            state.items = []
+        state.depth = getattr(state, 'depth', 0) + 1
+        try:
+            yield self
+        finally:
+            state.depth -= 1
+            if state.depth == 0:
+                self.flush_batch()
+
+    def flush_batch(self) -> None:
+        state = self.batch_state
+        items = getattr(state, 'items', None)
+        if not items:
+            return
+        state.items = []
+        # sent or dropped while disconnected, from now on a reconnection replays them
+        with self.conn_lock:
+            if self.ipc_recv_thread is None:
+                self.start()
+            # built after connecting, the packets depend on the negotiated protocol
+            self.send_packets(self.tree_packets([item_kwargs(obj, self.version) for obj in items]))
+            with self.registry_lock:
+                self.unsent.difference_update(obj.uuid for obj in items)
+
+    def tree_packets(self, items: List[dict]) -> List[IPCPacket]:
+        if self.version >= PROTOCOL_BINARY:
+            return [IPCPacket(action='create_tree', kwargs={'items': items})]
+        # server without create_tree, still a single sendall for the whole batch
+        return [IPCPacket(action='create_item', kwargs=kwargs) for kwargs in items]
+
+    def add(self, obj: 'Item') -> None:
+        if getattr(self.batch_state, 'depth', 0):
+            self.batch_state.items.append(obj)
+            with self.registry_lock:
+                self.unsent.add(obj.uuid)
+            self.register(obj)
+            return
+        # registered together with the send, a reconnection in between would create the item twice or never
+        with self.conn_lock:
+            self.flush_batch()
+            if self.ipc_recv_thread is None:
+                self.start()
+            self.send_packets([IPCPacket(action='create_item', kwargs=item_kwargs(obj, self.version))])
+            self.register(obj)
+
+# connects on the first item created, importing jetcard.menu works without a running display server
 oled_menu = OLEDMenu()
 
 def reset_menu():
     global oled_menu
     oled_menu.reset()
 
+def batch():
+    global oled_menu
+    return oled_menu.batch()
+
+def callback_status():
+    global oled_menu
+    return oled_menu.callback_status()
+
+def connection_status():
+    global oled_menu
+    return oled_menu.connection_status()
+
+def close():
+    global oled_menu
+    oled_menu.close()
+
 class Item:
+    create_type = 'item'    # item class created by the display server
+
     def __init__(self, *args, root=None, description="", **kwargs):
         global oled_menu
         self.root = root
@@ -80,6 +539,8 @@ class Item:
         pass
 
 class Menu(Item):
+    create_type = 'menu'
+
     def __init__(self, *args, root=None, description="", **kwargs):
         super().__init__(*args, root=root, description=description, **kwargs)
         
@@ -87,37 +548,88 @@ class Menu(Item):
         global oled_menu
         if hasattr(self, 'uuid'):
             oled_menu.send(IPCPacket(action='reset_menu', kwargs={'uuid': self.uuid}))
+            oled_menu.drop_children(self.uuid)
+
+class Console(Menu):
+    create_type = 'console'
+
+    def __init__(self, *args, root=None, description="", capacity=CONSOLE_CAPACITY, **kwargs):
+        '''
+        Scrolling text view, the OLED keeps the last `capacity` printed lines
+        '''
+        self.capacity = capacity
+        super().__init__(*args, root=root, description=description, **kwargs)
+
+    def print(self, *args):
+        global oled_menu
+        oled_menu.console_print(self, *args)
+
+    def reset(self):
+        global oled_menu
+        if hasattr(self, 'uuid'):
+            oled_menu.console_writer.discard(self.uuid)
+        super().reset()
     
 class Function(Menu):
-    def __init__(self, callback_func, *args, root=None, description="", **kwargs):
+    create_type = 'func'
+
+    def __init__(self, callback_func, *args, root=None, description="", policy='queue', timeout=None, **kwargs):
         '''
         Callback argument: callback_func(self)
         Callback return: if return is True, the OLED menu will go back to the main menu immediately
+        policy: 'queue', 'drop' or 'replace', handling of a call arriving while the callback still runs
+        timeout: seconds after which the callback is cancelled and the OLED menu is released, None to wait forever
         '''
+        assert policy in ('queue', 'drop', 'replace'), "policy must be 'queue', 'drop' or 'replace'"
         self.callback = callback_func
-        self.callback_thread = None
+        self.policy = policy
+        self.timeout = timeout
+        self._active_run: Union[CallbackRun, None] = None
+        self._pending_runs: collections.deque = collections.deque()
         super().__init__(*args, root=root, description=description, **kwargs)
         
     # used by OLEDMenu class only
     def update(self, value):
-        if self.callback_thread != None:
-            self.callback_thread.join()
-        self.callback_thread = threading.Thread(target=self.callback_wrapper)
-        self.callback_thread.start()
-        
-    def callback_wrapper(self):
         global oled_menu
-        ret = True if self.callback == None else self.callback(self)
+        # the server clears the printed lines when the function is called again
+        oled_menu.drop_children(self.uuid)
+        oled_menu.console_writer.discard(self.uuid)
+        oled_menu.executor.submit(self)
+
+    def cancelled(self) -> bool:
+        '''
+        True when the call running in this thread timed out or was replaced, long callbacks should poll it and return
+        '''
+        global oled_menu
+        run = oled_menu.executor.current_run()
+        return run is not None and run.func is self and run.cancelled
+
+    def complete(self, immediate_return: bool) -> None:
+        global oled_menu
         if hasattr(self, 'uuid'):
-            oled_menu.send(IPCPacket(action='update_value', kwargs={'uuid':self.uuid, 'value':ret==True}))
+            # printed lines go out before the completion
+            oled_menu.console_writer.flush(self.uuid)
+            oled_menu.send(IPCPacket(action='update_value', kwargs={'uuid':self.uuid, 'value':immediate_return}))
             
     def callback_print(self, *args):
-        print_data = ""
-        for arg in args:
-            print_data += str(arg) + " "
-        item = Item(root=self, description=print_data)
+        global oled_menu
+        if self.cancelled():
+            return
+        oled_menu.console_print(self, *args)
     
+class Graph(Item):
+    create_type = 'graph'
+
+    def __init__(self, *args, root=None, description="", metric='cpu', **kwargs):
+        '''
+        Live sparkline page of a daemon metric: 'cpu', 'gpu', 'power' or 'ram'
+        '''
+        self.metric = metric
+        super().__init__(*args, root=root, description=description, **kwargs)
+
 class Variable(Item):
+    create_type = 'var'
+
     def __init__(self, *args, root=None, value=None, step=None, description=None, **kwargs):
         self._value = value
         self._step = step
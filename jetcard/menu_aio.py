@@ -0,0 +1,304 @@
+'''
+asyncio client of the OLED quick menu, the counterpart of jetcard.menu for code already running an event loop.
+
+    oled = await connect()
+    lr = FloatVariable(oled, description='lr', value=0.001, step=0.0001)
+    run = Function(oled, start_training, description='train')     # async def start_training(func)
+    async for item, value in oled.changes():
+        ...
+
+Items are created synchronously (the packet is queued on the transport), every
+incoming packet is handled on the event loop without extra threads.
+'''
+import asyncio
+import collections
+import inspect
+import uuid
+from typing import Any, AsyncIterator, Callable, Dict, List, Tuple, Union
+from jetcard.display_server import CONSOLE_CAPACITY, IPCPacket
+from jetcard.protocol import HEADER_SIZE, PROTOCOL_BINARY, PROTOCOL_JSON, PROTOCOL_VERSION, announced_version, frame, frame_length, item_kwargs
+
+MENU_ADDRESS = '/tmp/menu_socket'
+
+
+class AsyncOLEDMenu:
+    def __init__(self, address: str = MENU_ADDRESS, console_interval: float = 0.05) -> None:
+        self.address = address
+        self.console_interval = console_interval
+        self.console_pending: Dict[str, collections.deque] = {}
+        self.console_flush_handle: Union[asyncio.TimerHandle, None] = None
+        self.loop: Union[asyncio.AbstractEventLoop, None] = None
+        self.version: int = PROTOCOL_JSON
+        self.reader: Union[asyncio.StreamReader, None] = None
+        self.writer: Union[asyncio.StreamWriter, None] = None
+        self.registry: Dict[str, 'Item'] = {}
+        self.children: Dict[str, List[str]] = {}
+        self.subscribers: List[asyncio.Queue] = []
+        self.recv_task: Union[asyncio.Task, None] = None
+        self.actions = {'update_value': self.update_value}
+
+    async def connect(self, handshake_timeout: float = 1.0) -> 'AsyncOLEDMenu':
+        self.loop = asyncio.get_running_loop()
+        self.reader, self.writer = await asyncio.open_unix_connection(self.address)
+        try:
+            # servers supporting the handshake announce themselves, older ones would reject a hello
+            packet = await asyncio.wait_for(self._read_packet(), handshake_timeout)
+            if (announced_version(packet.action, packet.kwargs) or PROTOCOL_JSON) > PROTOCOL_JSON:
+                self.send(IPCPacket(action='hello', kwargs={'version': PROTOCOL_VERSION}))
+                packet = await asyncio.wait_for(self._read_packet(), handshake_timeout)
+                if packet.action == 'hello':
+                    self.version = min(int(packet.kwargs.get('version', PROTOCOL_JSON)), PROTOCOL_VERSION)
+        except asyncio.TimeoutError:
+            pass    # server without handshake support, keep JSON
+        self.recv_task = asyncio.get_running_loop().create_task(self._recv_loop())
+        return self
+
+    async def close(self) -> None:
+        if self.recv_task is not None:
+            self.recv_task.cancel()
+            self.recv_task = None
+        if self.writer is not None:
+            self.writer.close()
+            await self.writer.wait_closed()
+            self.writer = None
+
+    async def _read_packet(self) -> IPCPacket:
+        header_size = HEADER_SIZE[self.version]
+        header = await self.reader.readexactly(header_size)
+        payload = await self.reader.readexactly(frame_length(header, 0, self.version))
+        return IPCPacket.decode(payload, self.version)
+
+    async def _recv_loop(self) -> None:
+        try:
+            while True:
+                packet = await self._read_packet()
+                action = self.actions.get(packet.action)
+                if action is not None:
+                    action(*packet.args, **packet.kwargs)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            # server went away, end every changes() iterator
+            for subscriber in self.subscribers:
+                subscriber.put_nowait(None)
+
+    def send(self, packet: IPCPacket) -> None:
+        self.writer.write(frame(packet.encode(self.version), self.version))
+
+    async def drain(self) -> None:
+        await self.writer.drain()
+
+    def console_print(self, console: 'Menu', *args) -> None:
+        if not self._in_loop():
+            # printed from a plain callback running in the executor
+            self.loop.call_soon_threadsafe(self.console_print, console, *args)
+            return
+        line = " ".join(str(arg) for arg in args)
+        if self.version < PROTOCOL_BINARY:
+            # server without console support, one item per line
+            Item(self, root=console, description=line + " ")
+            return
+        lines = self.console_pending.get(console.uuid)
+        if lines is None:
+            lines = self.console_pending[console.uuid] = collections.deque(maxlen=getattr(console, 'capacity', CONSOLE_CAPACITY))
+        lines.append(line)
+        if self.console_flush_handle is None:
+            # coalesce the lines printed within console_interval into one append_lines packet
+            self.console_flush_handle = self.loop.call_later(self.console_interval, self.flush_console)
+
+    def _in_loop(self) -> bool:
+        try:
+            return asyncio.get_running_loop() is self.loop
+        except RuntimeError:
+            return False
+
+    def flush_console(self, uuid: Union[str, None] = None) -> None:
+        if uuid is None:
+            pending, self.console_pending = self.console_pending, {}
+            if self.console_flush_handle is not None:
+                self.console_flush_handle.cancel()
+                self.console_flush_handle = None
+        else:
+            lines = self.console_pending.pop(uuid, None)
+            pending = {uuid: lines} if lines else {}
+        for uuid, lines in pending.items():
+            self.send(IPCPacket(action='append_lines', kwargs={'uuid': uuid, 'lines': list(lines)}))
+
+    def reset(self) -> None:
+        self.console_pending.clear()
+        self.send(IPCPacket(action='reset_menu'))
+        self.registry.clear()
+        self.children.clear()
+
+    def register(self, obj: 'Item') -> None:
+        self.registry[obj.uuid] = obj
+        self.children.setdefault(obj.root.uuid if obj.root else 'base', []).append(obj.uuid)
+
+    def drop_children(self, uuid: str) -> None:
+        pending = self.children.pop(uuid, [])
+        while pending:
+            child = pending.pop()
+            self.registry.pop(child, None)
+            pending += self.children.pop(child, [])
+
+    def add(self, obj: 'Item') -> None:
+        self.send(IPCPacket(action='create_item', kwargs=item_kwargs(obj, self.version)))
+        self.register(obj)
+
+    def update_value(self, *args, uuid: Union[str, None] = None, value: Any = True, **kwargs) -> None:
+        item = self.registry.get(uuid)
+        if item is None:
+            return
+        item.update(value)
+        if isinstance(item, Variable):
+            for subscriber in self.subscribers:
+                subscriber.put_nowait((item, item.get_value()))
+
+    async def changes(self) -> AsyncIterator[Tuple['Variable', Any]]:
+        '''
+        Yield (variable, value) every time a value is accepted on the OLED, ends when the connection closes
+        '''
+        subscriber: asyncio.Queue = asyncio.Queue()
+        self.subscribers.append(subscriber)
+        try:
+            while True:
+                change = await subscriber.get()
+                if change is None:
+                    return
+                yield change
+        finally:
+            self.subscribers.remove(subscriber)
+
+
+async def connect(address: str = MENU_ADDRESS) -> AsyncOLEDMenu:
+    return await AsyncOLEDMenu(address).connect()
+
+
+class Item:
+    create_type = 'item'    # item class created by the display server
+
+    def __init__(self, oled: AsyncOLEDMenu, *args, root=None, description="", **kwargs):
+        self.oled = oled
+        self.root = root
+        self._description = description
+        self.uuid = str(uuid.uuid4())
+        oled.add(self)
+
+    def get_description(self):
+        return self._description
+
+    # used by AsyncOLEDMenu class only
+    def update(self, value: Union[Any, None] = None):
+        pass
+
+class Menu(Item):
+    create_type = 'menu'
+
+    def reset(self):
+        self.oled.send(IPCPacket(action='reset_menu', kwargs={'uuid': self.uuid}))
+        self.oled.drop_children(self.uuid)
+        self.oled.console_pending.pop(self.uuid, None)
+
+class Console(Menu):
+    create_type = 'console'
+
+    def __init__(self, oled: AsyncOLEDMenu, *args, root=None, description="", capacity=CONSOLE_CAPACITY, **kwargs):
+        '''
+        Scrolling text view, the OLED keeps the last `capacity` printed lines
+        '''
+        self.capacity = capacity
+        super().__init__(oled, *args, root=root, description=description, **kwargs)
+
+    def print(self, *args):
+        self.oled.console_print(self, *args)
+
+class Function(Menu):
+    create_type = 'func'
+
+    def __init__(self, oled: AsyncOLEDMenu, callback_func: Union[Callable, None], *args, root=None, description="", **kwargs):
+        '''
+        Callback argument: callback_func(self), either a coroutine function or a plain function (run in the default executor)
+        Callback return: if return is True, the OLED menu will go back to the main menu immediately
+        '''
+        self.callback = callback_func
+        self.callback_task: Union[asyncio.Task, None] = None
+        super().__init__(oled, *args, root=root, description=description, **kwargs)
+
+    # used by AsyncOLEDMenu class only
+    def update(self, value):
+        previous = self.callback_task
+        self.callback_task = asyncio.get_running_loop().create_task(self.callback_wrapper(previous))
+
+    async def callback_wrapper(self, previous: Union[asyncio.Task, None]) -> None:
+        if previous is not None:
+            await asyncio.wait([previous])
+        # the server clears the printed lines when the function is called again
+        self.oled.drop_children(self.uuid)
+        self.oled.console_pending.pop(self.uuid, None)
+        ret = False
+        try:
+            if self.callback is None:
+                ret = True
+            elif inspect.iscoroutinefunction(self.callback):
+                ret = await self.callback(self)
+            else:
+                ret = await asyncio.get_running_loop().run_in_executor(None, self.callback, self)
+        except Exception as e:
+            # still complete below, the OLED would stay on the function screen otherwise
+            self.callback_print('error:', e)
+        # printed lines go out before the completion
+        self.oled.flush_console(self.uuid)
+        self.oled.send(IPCPacket(action='update_value', kwargs={'uuid': self.uuid, 'value': ret == True}))
+
+    def callback_print(self, *args):
+        self.oled.console_print(self, *args)
+
+class Graph(Item):
+    create_type = 'graph'
+
+    def __init__(self, oled: AsyncOLEDMenu, *args, root=None, description="", metric='cpu', **kwargs):
+        '''
+        Live sparkline page of a daemon metric: 'cpu', 'gpu', 'power' or 'ram'
+        '''
+        self.metric = metric
+        super().__init__(oled, *args, root=root, description=description, **kwargs)
+
+class Variable(Item):
+    create_type = 'var'
+
+    def __init__(self, oled: AsyncOLEDMenu, *args, root=None, value=None, step=None, description=None, **kwargs):
+        self._value = value
+        self._step = step
+        super().__init__(oled, *args, root=root, description=description, **kwargs)
+
+    def get_value(self):
+        return self._value
+
+    async def set_value(self, value):
+        self._value = value
+        self.oled.send(IPCPacket(action='update_value', kwargs={'uuid': self.uuid, 'value': value}))
+        await self.oled.drain()
+
+    def get_step(self):
+        return self._step
+
+class FloatVariable(Variable):
+    def __init__(self, oled: AsyncOLEDMenu, *args, root=None, value=0.0, step=0.1, description='', **kwargs):
+        super().__init__(oled, *args, root=root, value=float(value), step=step, description=description, **kwargs)
+
+    def update(self, value):
+        self._value = float(value)
+
+class IntVariable(Variable):
+    def __init__(self, oled: AsyncOLEDMenu, *args, root=None, value=0, step=1, description='', **kwargs):
+        super().__init__(oled, *args, root=root, value=int(value), step=step, description=description, **kwargs)
+
+    def update(self, value):
+        self._value = int(value)
+
+class BoolVariable(Variable):
+    def __init__(self, oled: AsyncOLEDMenu, *args, root=None, value=True, description='', **kwargs):
+        super().__init__(oled, *args, root=root, value=bool(value), step=None, description=description, **kwargs)
+
+    def update(self, value):
+        self._value = bool(value)
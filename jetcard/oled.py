@@ -0,0 +1,208 @@
+import collections
+import time
+import numpy as np
+import PIL.Image
+import PIL.ImageDraw
+from typing import Any, List, Sequence, Tuple, Union
+
+SSD1306_COLUMNADDR = 0x21
+SSD1306_PAGEADDR = 0x22
+I2C_CHUNK_SIZE = 16     # same data chunking as Adafruit_SSD1306.display()
+COMMAND_COST = 2        # control byte + command byte for every command write
+
+
+def image_to_pages(image: PIL.Image.Image) -> np.ndarray:
+    '''
+    Convert a mode '1' image to the SSD1306 page-major buffer layout.
+
+    Each byte holds 8 vertical pixels of one column, the top pixel in the least
+    significant bit, pages follow each other from top to bottom.
+    return uint8 array of length width * height // 8
+    '''
+    if image.mode != '1':
+        raise ValueError('Image must be in mode 1.')
+    width, height = image.size
+    pixels = np.asarray(image, dtype=np.bool_).reshape(height // 8, 8, width)
+    return np.packbits(pixels, axis=1, bitorder='little').reshape(-1)
+
+
+def load_image(display, image: PIL.Image.Image) -> None:
+    '''
+    Vectorized replacement of Adafruit_SSD1306 display.image()
+    '''
+    if image.size != (display.width, display.height):
+        raise ValueError('Image must be same dimensions as display ({0}x{1}).'.format(display.width, display.height))
+    display._buffer = image_to_pages(image).tolist()
+
+
+class TextCache:
+    '''
+    LRU cache of rendered 1-bit text bitmaps, blitted with ImageDraw.bitmap instead of
+    rasterizing the string again on every frame.
+
+    Bitmaps are text masks keyed by (text, font), the fill colour is applied when
+    blitting so one entry serves both the normal and the inverted (selected) line.
+    '''
+    def __init__(self, max_entries: int = 512) -> None:
+        self.max_entries = max_entries
+        self.entries: 'collections.OrderedDict[Tuple[str, Any], Union[PIL.Image.Image, None]]' = collections.OrderedDict()
+        self.hits: int = 0
+        self.misses: int = 0
+
+    def bitmap(self, text: str, font: Any) -> Union[PIL.Image.Image, None]:
+        '''
+        return the mask of text drawn at (0, 0), None for text without any pixel
+        '''
+        key = (text, font)
+        try:
+            mask = self.entries[key]
+        except KeyError:
+            self.misses += 1
+            mask = self.render(text, font)
+            self.entries[key] = mask
+            if len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            return mask
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return mask
+
+    @staticmethod
+    def render(text: str, font: Any) -> Union[PIL.Image.Image, None]:
+        right, bottom = font.getbbox(text)[2:]
+        if right <= 0 or bottom <= 0:
+            return None
+        # glyphs may overhang the layout box, draw with a margin and crop to the inked pixels
+        mask = PIL.Image.new('1', (right + bottom, bottom * 2))
+        PIL.ImageDraw.Draw(mask).text((0, 0), text, font=font, fill=255)
+        box = mask.getbbox()
+        return mask.crop((0, 0, box[2], box[3])) if box else None
+
+    def draw_text(self, draw: PIL.ImageDraw.ImageDraw, xy: Tuple[int, int], text: str, font: Any, fill: int = 255) -> None:
+        '''
+        Same result as draw.text(xy, text, font=font, fill=fill)
+        '''
+        mask = self.bitmap(text, font)
+        if mask is not None:
+            draw.bitmap(xy, mask, fill=fill)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+
+class FramePusher:
+    '''
+    Push SSD1306 page buffers to the panel, sending only the changed region.
+
+    The last frame sent is kept, every new frame is compared page by page and
+    only the changed column range is written using the controller's
+    column/page addressing. Nothing is sent when the frame is unchanged.
+    '''
+    def __init__(self, display, rate_window: float = 1.0) -> None:
+        self.display = display
+        self.width: int = display.width
+        self.pages: int = display.height // 8
+        self.last_frame: Union[np.ndarray, None] = None
+        self.rate_window = rate_window
+        self.bytes_sent: int = 0            # total bytes written since start
+        self.frames_pushed: int = 0         # frames which caused a transfer
+        self.frames_skipped: int = 0        # frames identical to the last one
+        self._rate: float = 0.0             # bytes per second of the last completed window
+        self._window_start = time.monotonic()
+        self._window_bytes = 0
+
+    def invalidate(self) -> None:
+        '''
+        Forget the last frame, the next push will send the whole frame.
+        '''
+        self.last_frame = None
+
+    def dirty_pages(self, frame: Sequence[int]) -> List[Tuple[int, int, int]]:
+        '''
+        return list of (page, first column, last column) that differ from the last frame
+        '''
+        if self.last_frame is None:
+            return [(page, 0, self.width - 1) for page in range(self.pages)]
+        changed = (np.asarray(frame, dtype=np.uint8) != self.last_frame).reshape(self.pages, self.width)
+        pages = np.flatnonzero(changed.any(axis=1))
+        if len(pages) == 0:
+            return []
+        rows = changed[pages]
+        first = rows.argmax(axis=1)
+        last = self.width - 1 - rows[:, ::-1].argmax(axis=1)
+        return list(zip(pages.tolist(), first.tolist(), last.tolist()))
+
+    def push(self, frame: Sequence[int]) -> int:
+        '''
+        return number of bytes written to the display
+        '''
+        frame = np.array(frame, dtype=np.uint8)
+        dirty = self.dirty_pages(frame)
+        sent = 0
+        if dirty:
+            sent = self._write_regions(frame, dirty)
+            self.last_frame = frame
+            self.frames_pushed += 1
+        else:
+            self.frames_skipped += 1
+        self._account(sent)
+        return sent
+
+    def _write_regions(self, frame: np.ndarray, dirty: List[Tuple[int, int, int]]) -> int:
+        # one bounding window costs a single addressing sequence but also rewrites clean bytes,
+        # separate windows per page only write dirty bytes, use whichever is cheaper on the bus
+        first_page, last_page = dirty[0][0], dirty[-1][0]
+        first_col = min(d[1] for d in dirty)
+        last_col = max(d[2] for d in dirty)
+        union_len = (last_page - first_page + 1) * (last_col - first_col + 1)
+        union_cost = self._window_cost(union_len)
+        split_cost = sum(self._window_cost(d[2] - d[1] + 1) for d in dirty)
+        if union_cost <= split_cost:
+            windows = [(first_page, last_page, first_col, last_col)]
+        else:
+            windows = [(page, page, first, last) for page, first, last in dirty]
+        sent = 0
+        pages = frame.reshape(self.pages, self.width)
+        for page_start, page_end, col_start, col_end in windows:
+            data = pages[page_start:page_end + 1, col_start:col_end + 1].reshape(-1).tolist()
+            sent += self._write_window(page_start, page_end, col_start, col_end, data)
+        return sent
+
+    @staticmethod
+    def _window_cost(data_len: int) -> int:
+        chunks = (data_len + I2C_CHUNK_SIZE - 1) // I2C_CHUNK_SIZE
+        return 6 * COMMAND_COST + data_len + chunks
+
+    def _write_window(self, page_start: int, page_end: int, col_start: int, col_end: int, data: List[int]) -> int:
+        display = self.display
+        display.command(SSD1306_COLUMNADDR)
+        display.command(col_start)
+        display.command(col_end)
+        display.command(SSD1306_PAGEADDR)
+        display.command(page_start)
+        display.command(page_end)
+        if display._spi is not None:
+            display._gpio.set_high(display._dc)
+            display._spi.write(data)
+        else:
+            for i in range(0, len(data), I2C_CHUNK_SIZE):
+                display._i2c.writeList(0x40, data[i:i+I2C_CHUNK_SIZE])
+        return self._window_cost(len(data))
+
+    def _account(self, sent: int) -> None:
+        self.bytes_sent += sent
+        self._window_bytes += sent
+        now = time.monotonic()
+        elapsed = now - self._window_start
+        if elapsed >= self.rate_window:
+            self._rate = self._window_bytes / elapsed
+            self._window_start = now
+            self._window_bytes = 0
+
+    @property
+    def bytes_per_second(self) -> float:
+        # evaluated when read, once pushes stop the open window averages down to zero
+        elapsed = time.monotonic() - self._window_start
+        if elapsed >= self.rate_window:
+            return self._window_bytes / elapsed
+        return self._rate
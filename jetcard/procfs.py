@@ -0,0 +1,152 @@
+import fcntl
+import os
+import re
+import socket
+import struct
+import threading
+from typing import Dict, List, Tuple, Union
+
+SIOCGIFADDR = 0x8915
+POWER_MODEL_RE = re.compile(r'<\s*POWER_MODEL\s+ID=(\d+)\s+NAME=(\S+)\s*>')
+POWER_STATUS_RE = re.compile(r'pmode:(\d+)')
+
+
+class ProcFile:
+    '''
+    A procfs/sysfs file kept open and re-read from offset 0 with pread,
+    avoiding open/close on every sample.
+    '''
+    def __init__(self, path: str, chunk_size: int = 65536) -> None:
+        self.path = path
+        self.chunk_size = chunk_size
+        self.fd: int = os.open(path, os.O_RDONLY)
+
+    def read(self) -> bytes:
+        data = os.pread(self.fd, self.chunk_size, 0)
+        if len(data) < self.chunk_size:
+            return data
+        chunks = [data]
+        offset = len(data)
+        while True:
+            data = os.pread(self.fd, self.chunk_size, offset)
+            if not data:
+                return b''.join(chunks)
+            chunks.append(data)
+            offset += len(data)
+
+    def read_text(self) -> str:
+        return self.read().decode()
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class ProcfsBackend:
+    '''
+    Subprocess free implementation of the jetcard.utils metrics.
+
+    `root` is prepended to every procfs/sysfs path, pointing it to a fixture
+    tree allows running on any Linux machine.
+    '''
+    def __init__(self, root: str = '/') -> None:
+        self.root = root
+        self._files: Dict[str, ProcFile] = {}
+        self._lock = threading.Lock()
+        self._last_cpu: Union[Tuple[int, int], None] = None
+        self._power_models: Union[Dict[int, str], None] = None
+        self._socket: Union[socket.socket, None] = None
+
+    def path(self, path: str) -> str:
+        return os.path.join(self.root, path.lstrip('/'))
+
+    def file(self, path: str) -> ProcFile:
+        proc_file = self._files.get(path)
+        if proc_file is None:
+            proc_file = ProcFile(self.path(path))
+            self._files[path] = proc_file
+        return proc_file
+
+    def read(self, path: str) -> bytes:
+        '''
+        return the content of path, reopened once when the cached descriptor fails,
+        e.g. ENODEV after the device of a sysfs node went away and came back
+        '''
+        try:
+            return self.file(path).read()
+        except OSError:
+            proc_file = self._files.pop(path, None)
+            if proc_file is not None:
+                try:
+                    proc_file.close()
+                except OSError:
+                    pass
+            return self.file(path).read()
+
+    def close(self) -> None:
+        for proc_file in self._files.values():
+            proc_file.close()
+        self._files = {}
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+    def cpu_usage(self) -> float:
+        # aggregated "cpu" line: user nice system idle iowait irq softirq steal ...
+        fields = self.read('/proc/stat').split(b'\n', 1)[0].split()[1:9]
+        ticks: List[int] = [int(f) for f in fields]
+        total = sum(ticks)
+        idle = ticks[3] + ticks[4]
+        with self._lock:
+            last = self._last_cpu
+            self._last_cpu = (total, idle)
+        if last is not None and total > last[0]:
+            total, idle = total - last[0], idle - last[1]
+        return (total - idle) / total if total else 0.0
+
+    def memory_usage(self) -> float:
+        meminfo = {}
+        for line in self.read('/proc/meminfo').split(b'\n'):
+            key, _, value = line.partition(b':')
+            if value:
+                meminfo[key] = int(value.split()[0])
+        total = meminfo[b'MemTotal']
+        # same "used" definition as free: total - available, or total - free - buffers - cache on old kernels
+        if b'MemAvailable' in meminfo:
+            used = total - meminfo[b'MemAvailable']
+        else:
+            used = total - meminfo[b'MemFree'] - meminfo.get(b'Buffers', 0) - meminfo.get(b'Cached', 0) \
+                - meminfo.get(b'SReclaimable', 0)
+        return used / total
+
+    def disk_usage(self, path: str = '/') -> float:
+        stat = os.statvfs(self.path(path))
+        used = (stat.f_blocks - stat.f_bfree) * stat.f_frsize
+        available = stat.f_bavail * stat.f_frsize
+        # df percentage is used / (used + available to non root users)
+        return used / (used + available) if used + available else 0.0
+
+    def gpu_usage(self) -> float:
+        return float(self.read('/sys/devices/gpu.0/load')) / 1000.0
+
+    def power_usage(self) -> float:
+        return float(self.read('/sys/devices/50000000.host1x/546c0000.i2c/i2c-6/6-0040/iio:device0/in_power0_input')) / 1000.0
+
+    def power_mode(self) -> str:
+        if self._power_models is None:
+            with open(self.path('/etc/nvpmodel.conf'), 'r') as f:
+                self._power_models = {int(i): name for i, name in POWER_MODEL_RE.findall(f.read())}
+        status = POWER_STATUS_RE.search(self.read('/var/lib/nvpmodel/status').decode())
+        return self._power_models[int(status.group(1))]
+
+    def network_interface_state(self, interface: str) -> str:
+        return self.read('/sys/class/net/%s/operstate' % interface).decode().strip()
+
+    def ip_address(self, interface: str) -> Union[str, None]:
+        if self._socket is None:
+            self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            ifreq = fcntl.ioctl(self._socket.fileno(), SIOCGIFADDR, struct.pack('256s', interface[:15].encode()))
+        except OSError:
+            return None
+        address = socket.inet_ntoa(ifreq[20:24])
+        return None if address == '127.0.0.1' else address
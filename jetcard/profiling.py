@@ -0,0 +1,118 @@
+import contextlib
+import os
+import threading
+import time
+from typing import Dict, List
+
+PROFILE_ENV = 'JETCARD_PROFILE'
+SUB_BUCKETS = 4     # log-linear buckets per power of two, percentiles are within 25%
+
+
+def _bucket(ns: int) -> int:
+    if ns < SUB_BUCKETS:
+        return max(ns, 0)
+    bits = ns.bit_length()
+    return SUB_BUCKETS * (bits - 2) + ((ns >> (bits - 3)) & (SUB_BUCKETS - 1))
+
+
+def _bucket_limit(index: int) -> int:
+    # largest value falling in the bucket
+    if index < SUB_BUCKETS:
+        return index
+    shift = index // SUB_BUCKETS - 1
+    return ((SUB_BUCKETS + index % SUB_BUCKETS + 1) << shift) - 1
+
+
+class Histogram:
+    '''
+    Constant size log-linear histogram of durations in nanoseconds
+    '''
+    def __init__(self) -> None:
+        self.counts: List[int] = [0] * (SUB_BUCKETS * 64)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.lock = threading.Lock()
+
+    def record(self, ns: int) -> None:
+        index = _bucket(ns)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += ns
+            if ns > self.max:
+                self.max = ns
+
+    def percentile(self, q: float) -> int:
+        '''
+        return the upper bound of the bucket holding the q-th percentile, in nanoseconds
+        '''
+        with self.lock:
+            rank = q / 100.0 * self.count
+            seen = 0
+            for index, count in enumerate(self.counts):
+                seen += count
+                if count and seen >= rank:
+                    return min(_bucket_limit(index), self.max)
+            return self.max
+
+
+class _Stage:
+    __slots__ = ('histogram', 'start')
+
+    def __init__(self, histogram: Histogram) -> None:
+        self.histogram = histogram
+
+    def __enter__(self) -> None:
+        self.start = time.monotonic_ns()
+
+    def __exit__(self, *exc) -> None:
+        self.histogram.record(time.monotonic_ns() - self.start)
+
+
+_disabled = contextlib.nullcontext()
+
+
+class Timings:
+    '''
+    Per stage timing histograms of the display daemon.
+
+        with timings.measure('display.push'):
+            ...
+
+    When disabled measure() returns a shared no-op context manager, so the
+    instrumentation can stay in place on production boards.
+    '''
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.stages: Dict[str, Histogram] = {}
+        self.lock = threading.Lock()
+
+    def measure(self, stage: str):
+        if not self.enabled:
+            return _disabled
+        histogram = self.stages.get(stage)
+        if histogram is None:
+            with self.lock:
+                histogram = self.stages.setdefault(stage, Histogram())
+        return _Stage(histogram)
+
+    def reset(self) -> None:
+        with self.lock:
+            self.stages = {}
+
+    def report(self) -> str:
+        if not self.enabled and not self.stages:
+            return 'profiling disabled, start with --profile or %s=1' % PROFILE_ENV
+        lines = ['{s:<16} {c:>9} {p50:>10} {p99:>10} {m:>10} {mean:>10}'.format(
+            s='stage', c='count', p50='p50 us', p99='p99 us', m='max us', mean='mean us')]
+        for stage, histogram in sorted(self.stages.items()):
+            if not histogram.count:
+                continue
+            lines.append('{s:<16} {c:>9} {p50:>10.1f} {p99:>10.1f} {m:>10.1f} {mean:>10.1f}'.format(
+                s=stage, c=histogram.count, p50=histogram.percentile(50) / 1e3, p99=histogram.percentile(99) / 1e3,
+                m=histogram.max / 1e3, mean=histogram.total / histogram.count / 1e3))
+        return '\n'.join(lines)
+
+
+timings = Timings(enabled=os.environ.get(PROFILE_ENV, '') not in ('', '0'))
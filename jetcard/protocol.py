@@ -0,0 +1,227 @@
+import json
+import struct
+from typing import Any, List, Tuple, Union
+
+PROTOCOL_JSON = 1       # 2-byte little endian length + JSON, used until a hello handshake succeeds
+PROTOCOL_BINARY = 2     # 4-byte little endian length + binary encoding below
+PROTOCOL_VERSION = PROTOCOL_BINARY
+HEADER_SIZE = {PROTOCOL_JSON: 2, PROTOCOL_BINARY: 4}
+JSON_MAX_PACKET = 0xFFFF
+
+# action and keyword tables of the binary encoding, append only so ids stay stable
+ACTIONS = ['hello', 'reset_menu', 'create_item', 'update_value', 'create_tree', 'append_lines']
+KEYS = ['uuid', 'value', 'root', 'name', 'create_type', 'step', 'version', 'items', 'lines', 'capacity', 'metric']
+ACTION_IDS = {action: i for i, action in enumerate(ACTIONS)}
+KEY_IDS = {key: i for i, key in enumerate(KEYS)}
+CUSTOM_ID = 0xFF    # followed by the string itself when the action / key is not in the table
+
+_header = struct.Struct('<BHH')     # action id, number of args, number of kwargs
+_u32 = struct.Struct('<I')
+_i8 = struct.Struct('<b')
+_i64 = struct.Struct('<q')
+_f64 = struct.Struct('<d')
+
+# value tags
+TAG_NONE = 0x4E     # 'N'
+TAG_TRUE = 0x54     # 'T'
+TAG_FALSE = 0x46    # 'F'
+TAG_INT8 = 0x62     # 'b'
+TAG_INT64 = 0x71    # 'q'
+TAG_BIGINT = 0x6E   # 'n', decimal string
+TAG_FLOAT = 0x64    # 'd'
+TAG_STR = 0x73      # 's'
+TAG_LIST = 0x6C     # 'l'
+TAG_DICT = 0x6D     # 'm'
+
+
+def _encode_str(value: str, out: List[bytes]) -> None:
+    data = value.encode()
+    out.append(_u32.pack(len(data)))
+    out.append(data)
+
+
+def _encode_key(key: str, out: List[bytes]) -> None:
+    key_id = KEY_IDS.get(key)
+    if key_id is None:
+        out.append(b'\xff')
+        _encode_str(key, out)
+    else:
+        out.append(bytes((key_id,)))
+
+
+def encode_value(value: Any, out: List[bytes]) -> None:
+    value_type = type(value)
+    if value_type is str:
+        out.append(b's')
+        _encode_str(value, out)
+    elif value is None:
+        out.append(b'N')
+    elif value_type is bool:
+        out.append(b'T' if value else b'F')
+    elif value_type is int:
+        if -128 <= value < 128:
+            out.append(b'b' + _i8.pack(value))
+        elif -(1 << 63) <= value < (1 << 63):
+            out.append(b'q' + _i64.pack(value))
+        else:
+            out.append(b'n')
+            _encode_str(str(value), out)
+    elif value_type is float:
+        out.append(b'd' + _f64.pack(value))
+    elif value_type is list or value_type is tuple:
+        out.append(b'l' + _u32.pack(len(value)))
+        for v in value:
+            encode_value(v, out)
+    elif value_type is dict:
+        out.append(b'm' + _u32.pack(len(value)))
+        for k, v in value.items():
+            _encode_key(k, out)
+            encode_value(v, out)
+    else:
+        raise TypeError('cannot encode value of type %s' % value_type.__name__)
+
+
+def _decode_str(data: bytes, offset: int) -> Tuple[str, int]:
+    length, = _u32.unpack_from(data, offset)
+    offset += 4
+    return data[offset:offset + length].decode(), offset + length
+
+
+def _decode_key(data: bytes, offset: int) -> Tuple[str, int]:
+    key_id = data[offset]
+    if key_id == CUSTOM_ID:
+        return _decode_str(data, offset + 1)
+    return KEYS[key_id], offset + 1
+
+
+def decode_value(data: bytes, offset: int) -> Tuple[Any, int]:
+    tag = data[offset]
+    offset += 1
+    if tag == TAG_STR:
+        return _decode_str(data, offset)
+    if tag == TAG_NONE:
+        return None, offset
+    if tag == TAG_TRUE:
+        return True, offset
+    if tag == TAG_FALSE:
+        return False, offset
+    if tag == TAG_INT8:
+        return _i8.unpack_from(data, offset)[0], offset + 1
+    if tag == TAG_INT64:
+        return _i64.unpack_from(data, offset)[0], offset + 8
+    if tag == TAG_FLOAT:
+        return _f64.unpack_from(data, offset)[0], offset + 8
+    if tag == TAG_BIGINT:
+        text, offset = _decode_str(data, offset)
+        return int(text), offset
+    if tag == TAG_LIST:
+        count, = _u32.unpack_from(data, offset)
+        offset += 4
+        values = []
+        for _ in range(count):
+            value, offset = decode_value(data, offset)
+            values.append(value)
+        return values, offset
+    if tag == TAG_DICT:
+        count, = _u32.unpack_from(data, offset)
+        offset += 4
+        values = {}
+        for _ in range(count):
+            key, offset = _decode_key(data, offset)
+            values[key], offset = decode_value(data, offset)
+        return values, offset
+    raise ValueError('unknown value tag 0x%02x' % tag)
+
+
+def encode_binary(action: str, args: list, kwargs: dict) -> bytes:
+    action_id = ACTION_IDS.get(action, CUSTOM_ID)
+    out = [_header.pack(action_id, len(args), len(kwargs))]
+    if action_id == CUSTOM_ID:
+        _encode_str(action, out)
+    for value in args:
+        encode_value(value, out)
+    for key, value in kwargs.items():
+        _encode_key(key, out)
+        encode_value(value, out)
+    return b''.join(out)
+
+
+def decode_binary(data: bytes) -> Tuple[str, list, dict]:
+    action_id, nargs, nkwargs = _header.unpack_from(data, 0)
+    offset = _header.size
+    if action_id == CUSTOM_ID:
+        action, offset = _decode_str(data, offset)
+    else:
+        action = ACTIONS[action_id]
+    args = []
+    for _ in range(nargs):
+        value, offset = decode_value(data, offset)
+        args.append(value)
+    kwargs = {}
+    for _ in range(nkwargs):
+        key, offset = _decode_key(data, offset)
+        kwargs[key], offset = decode_value(data, offset)
+    return action, args, kwargs
+
+
+def encode_json(action: str, args: list, kwargs: dict) -> bytes:
+    return json.dumps({'action': action, 'args': args, 'kwargs': kwargs}).encode()
+
+
+def decode_json(data: bytes) -> Tuple[str, list, dict]:
+    packet = json.loads(data.decode() if isinstance(data, (bytes, bytearray)) else data)
+    return packet['action'], packet['args'], packet['kwargs']
+
+
+def announcement(version: int = PROTOCOL_VERSION) -> Tuple[str, dict]:
+    '''
+    return action and kwargs a server sends to every accepted connection. It is an update_value for
+    no item, which clients predating the handshake already ignore.
+    '''
+    return 'update_value', {'uuid': None, 'version': version}
+
+
+def announced_version(action: str, kwargs: dict) -> Union[int, None]:
+    '''
+    return protocol version of a server announcement, None if the packet is not one
+    '''
+    if action == 'update_value' and kwargs.get('uuid') is None and 'version' in kwargs:
+        return int(kwargs['version'])
+    return None
+
+
+def item_kwargs(item: Any, version: int) -> dict:
+    '''
+    return the create_item kwargs of a jetcard.menu or jetcard.menu_aio item, by its create_type class attribute
+    '''
+    kwargs = {'root': item.root.uuid if item.root else 'base',
+              'name': item.get_description(),
+              'uuid': item.uuid,
+              'create_type': item.create_type}
+    if item.create_type == 'console':
+        if version >= PROTOCOL_BINARY:
+            kwargs['capacity'] = item.capacity
+        else:
+            # server without console support, the printed lines become items of a menu
+            kwargs['create_type'] = 'menu'
+    elif item.create_type == 'graph':
+        kwargs['metric'] = item.metric
+    elif item.create_type == 'var':
+        kwargs['value'] = item.get_value()
+        kwargs['step'] = item.get_step()
+    return kwargs
+
+
+def frame(payload: bytes, version: int) -> bytes:
+    length = len(payload)
+    if version == PROTOCOL_JSON:
+        if length > JSON_MAX_PACKET:
+            raise ValueError('packet of %d bytes does not fit the JSON protocol framing' % length)
+        return bytes((length & 0xFF, (length >> 8) & 0xFF)) + payload
+    return _u32.pack(length) + payload
+
+
+def frame_length(data: bytes, offset: int, version: int) -> int:
+    if version == PROTOCOL_JSON:
+        return data[offset] | (data[offset + 1] << 8)
+    return _u32.unpack_from(data, offset)[0]
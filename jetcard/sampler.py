@@ -0,0 +1,110 @@
+import threading
+import time
+from typing import Any, Callable, List, NamedTuple, Union
+from .profiling import timings
+
+IP_INTERFACES = ['eth0', 'eth0:avahi', 'wlan0']   # priority order of the interface shown on the OLED
+
+
+class StatsSnapshot(NamedTuple):
+    available: bool = False
+    timestamp: float = 0.0
+    ip_address: Union[str, None] = None
+    power_mode: str = ''
+    power_watts: float = 0.0
+    cpu_percent: float = 0.0
+    gpu_percent: float = 0.0
+    ram_percent: float = 0.0
+    disk_percent: float = 0.0
+
+
+def default_jtop_factory(interval: float) -> Any:
+    from jtop import jtop
+    return jtop(interval=interval)
+
+
+class JtopSampler(threading.Thread):
+    '''
+    Keep one jtop connection open and publish the latest StatsSnapshot.
+
+    The render loop reads `snapshot` without blocking, the snapshot object is
+    immutable and replaced as a whole on every sample. A lost connection is
+    retried with exponential backoff.
+    '''
+    def __init__(self, interval: float = 1.0, jtop_factory: Callable[[float], Any] = default_jtop_factory,
+                 min_backoff: float = 0.5, max_backoff: float = 30.0) -> None:
+        super().__init__(name='jtop-sampler', daemon=True)
+        self.interval = interval
+        self.jtop_factory = jtop_factory
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.snapshot: StatsSnapshot = StatsSnapshot()
+        self.generation: int = 0    # increased on every published snapshot
+        self.errors: int = 0
+        self.gpu_key: Union[str, None] = None
+        self.subscribers: List[Callable[[StatsSnapshot], None]] = []
+        self._stop_event = threading.Event()
+        self._reconnect = threading.Event()   # set by set_interval, jtop is reopened with the new interval
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+    def set_interval(self, interval: float) -> None:
+        '''
+        Change the sampling interval, takes effect after the current sample
+        '''
+        if interval != self.interval:
+            self.interval = interval
+            self._reconnect.set()
+
+    def run(self) -> None:
+        backoff = self.min_backoff
+        while not self._stop_event.is_set():
+            self._reconnect.clear()
+            try:
+                with self.jtop_factory(self.interval) as jetson:
+                    while not self._stop_event.is_set() and not self._reconnect.is_set() and jetson.ok():
+                        with timings.measure('jtop.sample'):
+                            snapshot = self.sample(jetson)
+                        self.publish(snapshot)
+                        backoff = self.min_backoff
+                if self._reconnect.is_set():
+                    continue
+            except Exception:
+                self.errors += 1
+                self.publish(StatsSnapshot(timestamp=time.time()))
+            self._stop_event.wait(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def subscribe(self, callback: Callable[[StatsSnapshot], None]) -> None:
+        '''
+        Call callback(snapshot) from the sampler thread on every published snapshot, it must not block
+        '''
+        self.subscribers.append(callback)
+
+    def publish(self, snapshot: StatsSnapshot) -> None:
+        self.snapshot = snapshot
+        self.generation += 1
+        for callback in self.subscribers:
+            callback(snapshot)
+
+    def sample(self, jetson: Any) -> StatsSnapshot:
+        interfaces = jetson.local_interfaces['interfaces']
+        ip_address = None
+        for interface in IP_INTERFACES:
+            if interface in interfaces:
+                ip_address = str(interfaces[interface])
+                break
+        if self.gpu_key not in jetson.gpu:
+            # discover the integrated GPU name once (e.g. 'gpu' on Nano, 'ga10b' on Orin)
+            self.gpu_key = next(iter(jetson.gpu), None)
+        gpu_percent = float(jetson.gpu[self.gpu_key]['status']['load']) if self.gpu_key else 0.0
+        return StatsSnapshot(available=True,
+                             timestamp=time.time(),
+                             ip_address=ip_address,
+                             power_mode=str(jetson.nvpmodel),
+                             power_watts=jetson.power['tot']['power'] / 1000,
+                             cpu_percent=100.0 - jetson.cpu['total']['idle'],
+                             gpu_percent=gpu_percent,
+                             ram_percent=jetson.memory['RAM']['used'] / jetson.memory['RAM']['tot'] * 100,
+                             disk_percent=jetson.disk['used'] / jetson.disk['total'] * 100)
@@ -0,0 +1,102 @@
+import threading
+import time
+from typing import Callable, Dict, List, Union
+
+
+class Task:
+    def __init__(self, name: str, interval: float, callback: Callable[[], None]) -> None:
+        self.name = name
+        self.interval = interval
+        self.callback = callback
+        self.next_run: float = time.monotonic()
+        self.runs: int = 0
+        self.missed: int = 0            # whole periods skipped because the task started late
+        self.max_lateness: float = 0.0
+        self.last_duration: float = 0.0
+        self.max_duration: float = 0.0
+
+
+class Scheduler:
+    '''
+    Run periodic tasks at their own rate from a single thread.
+
+    Every task has a deadline advanced by its interval after each run, the loop
+    sleeps until the earliest deadline. Deadlines are fixed rate: a slow task
+    only delays the tasks due while it runs, and a task starting more than one
+    period late counts the skipped periods in `missed` instead of running them
+    back to back. When `wakeup` is set the `wake` tasks are run right away.
+    '''
+    def __init__(self, wakeup: Union[threading.Event, None] = None, wake: List[str] = []) -> None:
+        self.wakeup = wakeup if wakeup is not None else threading.Event()
+        self.wake = list(wake)
+        self.tasks: List[Task] = []     # ties between due tasks run in insertion order
+        self.by_name: Dict[str, Task] = {}
+
+    def add(self, name: str, interval: float, callback: Callable[[], None]) -> Task:
+        task = Task(name, interval, callback)
+        self.tasks.append(task)
+        self.by_name[name] = task
+        return task
+
+    def set_interval(self, name: str, interval: float) -> None:
+        task = self.by_name[name]
+        if interval != task.interval:
+            task.next_run = min(task.next_run, time.monotonic() + interval)
+            task.interval = interval
+
+    def trigger(self, name: str) -> None:
+        '''
+        Make the task due now, it runs on the current or next pass of the loop
+        '''
+        task = self.by_name[name]
+        task.next_run = min(task.next_run, time.monotonic())
+
+    def next_deadline(self) -> float:
+        return min(task.next_run for task in self.tasks)
+
+    def run_pending(self) -> int:
+        '''
+        Run every due task once, earliest deadline first, return the number of tasks run
+        '''
+        pending = list(self.tasks)
+        ran = 0
+        while pending:
+            now = time.monotonic()
+            due = [task for task in pending if task.next_run <= now]
+            if not due:
+                break
+            task = min(due, key=lambda t: t.next_run)
+            pending.remove(task)
+            self._run(task, now)
+            ran += 1
+        return ran
+
+    def _run(self, task: Task, now: float) -> None:
+        lateness = now - task.next_run
+        task.max_lateness = max(task.max_lateness, lateness)
+        task.callback()
+        end = time.monotonic()
+        task.runs += 1
+        task.last_duration = end - now
+        task.max_duration = max(task.max_duration, task.last_duration)
+        task.next_run += task.interval
+        if task.next_run <= end:
+            skipped = int((end - task.next_run) // task.interval) + 1
+            task.missed += skipped
+            task.next_run += skipped * task.interval
+
+    def wait(self) -> None:
+        '''
+        Sleep until the next deadline, return early when wakeup is set
+        '''
+        timeout = self.next_deadline() - time.monotonic()
+        if timeout > 0 and self.wakeup.wait(timeout):
+            self.wakeup.clear()
+            for name in self.wake:
+                self.trigger(name)
+
+    def run(self, running: Callable[[], bool]) -> None:
+        while running():
+            self.run_pending()
+            if running():
+                self.wait()
@@ -26,6 +26,7 @@ from PIL import Image
 from PIL import ImageDraw
 from PIL import ImageFont
 from .utils import get_ip_address
+from .oled import load_image
 
 import subprocess
 
@@ -312,7 +313,7 @@ while True:
         draw.text((x, top+25),    str(Disk.decode('utf-8')),  font=font, fill=255)
     
         # Display image.
-        disp.image(image)
+        load_image(disp, image)
         disp.display()
         for i in range(10):
             if GPIO.event_detected(CENTER_CHANNEL):
@@ -360,7 +361,7 @@ while True:
                 das_count = 6
                 action = das_action
         menu_ptr = menu_ptr.display(draw, action)
-        disp.image(image)
+        load_image(disp, image)
         disp.display()
         if menu_ptr == None:
             menu_state = MENU_IDLE
@@ -0,0 +1,81 @@
+import json
+import threading
+from typing import Iterator, Union
+from .sampler import StatsSnapshot
+
+STREAM_SUBSCRIBERS = 8     # open /stats/stream readers, each one keeps an HTTP worker thread busy
+
+
+class SnapshotBroadcast:
+    '''
+    Fan sampler snapshots out to any number of Server-Sent Events readers.
+
+    Every snapshot is serialized once into a shared event, readers block on a
+    condition until the generation changes and all send the same bytes.
+    At most `max_subscribers` readers are served at once.
+    '''
+    def __init__(self, keepalive: float = 15.0, max_subscribers: int = STREAM_SUBSCRIBERS) -> None:
+        self.keepalive = keepalive
+        self.max_subscribers = max_subscribers
+        self.cond = threading.Condition()
+        self.event: bytes = b''
+        self.generation: int = 0
+        self.subscribers: int = 0
+        self.events_sent: int = 0
+
+    def publish(self, snapshot: StatsSnapshot) -> None:
+        data = json.dumps(snapshot._asdict())
+        with self.cond:
+            self.generation += 1
+            self.event = ('id: %d\nevent: stats\ndata: %s\n\n' % (self.generation, data)).encode()
+            self.cond.notify_all()
+
+    def stream(self) -> Union['Subscription', None]:
+        '''
+        Take a reader slot, return the events of the new reader or None when every slot is taken
+        '''
+        with self.cond:
+            if self.subscribers >= self.max_subscribers:
+                return None
+            self.subscribers += 1
+        return Subscription(self)
+
+    def events(self) -> Iterator[bytes]:
+        '''
+        Yield the latest event, then every new one. A comment line is sent after keepalive
+        seconds without samples so a closed connection is noticed.
+        '''
+        seen = 0
+        while True:
+            with self.cond:
+                if self.cond.wait_for(lambda: self.generation != seen, self.keepalive):
+                    seen = self.generation
+                    event = self.event
+                    self.events_sent += 1
+                else:
+                    event = b': keepalive\n\n'
+            yield event
+
+
+class Subscription:
+    '''
+    Events of one reader, its slot is given back by close(), which the WSGI server calls
+    even when the response was never iterated
+    '''
+    def __init__(self, broadcast: SnapshotBroadcast) -> None:
+        self.broadcast = broadcast
+        self.events = broadcast.events()
+        self.closed = False
+
+    def __iter__(self) -> 'Subscription':
+        return self
+
+    def __next__(self) -> bytes:
+        return next(self.events)
+
+    def close(self) -> None:
+        self.events.close()
+        with self.broadcast.cond:
+            if not self.closed:
+                self.closed = True
+                self.broadcast.subscribers -= 1
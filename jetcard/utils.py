@@ -1,7 +1,10 @@
-import subprocess
 import pkg_resources
 import platform
 import os
+from .procfs import ProcfsBackend
+
+# file descriptors of the procfs/sysfs files are kept open by the backend
+backend = ProcfsBackend()
 
 
 def notebooks_dir():
@@ -28,16 +31,14 @@ def ip_address(interface):
     try:
         if network_interface_state(interface) == 'down':
             return None
-        cmd = "ifconfig %s | grep -Eo 'inet (addr:)?([0-9]*\.){3}[0-9]*' | grep -Eo '([0-9]*\.){3}[0-9]*' | grep -v '127.0.0.1'" % interface
-        return subprocess.check_output(cmd, shell=True).decode('ascii')[:-1]
+        return backend.ip_address(interface)
     except:
         return None
 
 
 def network_interface_state(interface):
     try:
-        with open('/sys/class/net/%s/operstate' % interface, 'r') as f:
-            return f.read()
+        return backend.network_interface_state(interface)
     except:
         return 'down' # default to down
 
@@ -50,7 +51,7 @@ def power_mode():
     Returns:
         str: The current power mode.  Either 'MAXN' or '5W'.
     """
-    return subprocess.check_output("nvpmodel -q | grep -o '5W\|MAXN'", shell = True ).decode('utf-8').strip('\n')
+    return backend.power_mode()
 
 
 def power_usage():
@@ -59,17 +60,19 @@ def power_usage():
     Returns:
         float: The current power usage in Watts.
     """
-    with open("/sys/devices/50000000.host1x/546c0000.i2c/i2c-6/6-0040/iio:device0/in_power0_input", 'r') as f:
-        return float(f.read()) / 1000.0
+    return backend.power_usage()
 
     
 def cpu_usage():
     """Gets the Jetson's current CPU usage fraction
     
+    Computed from the ``/proc/stat`` tick counters since the previous call
+    (since boot on the first call).
+
     Returns:
         float: The current CPU usage fraction.
     """
-    return float(subprocess.check_output("top -bn1 | grep load | awk '{printf \"%.2f\", $(NF-2)}'", shell = True ).decode('utf-8'))
+    return backend.cpu_usage()
 
 
 def gpu_usage():
@@ -78,8 +81,7 @@ def gpu_usage():
     Returns:
         float: The current GPU usage fraction.
     """
-    with open('/sys/devices/gpu.0/load', 'r') as f:
-        return float(f.read().strip('\n')) / 1000.0
+    return backend.gpu_usage()
 
     
 def memory_usage():
@@ -88,7 +90,7 @@ def memory_usage():
     Returns:
         float: The current RAM usage fraction.
     """
-    return float(subprocess.check_output("free -m | awk 'NR==2{printf \"%.2f\", $3*100/$2 }'", shell = True ).decode('utf-8')) / 100.0
+    return backend.memory_usage()
 
 
 def disk_usage():
@@ -97,4 +99,4 @@ def disk_usage():
     Returns:
         float: The current disk usage fraction.
     """
-    return float(subprocess.check_output("df -h | awk '$NF==\"/\"{printf \"%s\", $5}'", shell = True ).decode('utf-8').strip('%')) / 100.0
\ No newline at end of file
+    return backend.disk_usage('/')
\ No newline at end of file
@@ -7,6 +7,10 @@ setup(
     packages=find_packages(),
     install_requires=[
         'Adafruit_SSD1306',
-        'Jetson.GPIO'
+        'Jetson.GPIO',
+        'numpy'
     ],
+    extras_require={
+        'web': ['flask', 'waitress'],
+    },
 )